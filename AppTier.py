@@ -0,0 +1,206 @@
+from stack_registry import registerStack, writeStack
+
+@registerStack("AppTier", "AppTier.yaml")
+def createAppTierTemplate(service="edx-platform", warm_pool=True):
+  from troposphere import Equals, GetAtt, If, Not, Parameter, Ref, Split, Template
+  from troposphere.autoscaling import AutoScalingGroup, LaunchTemplateSpecification, MetricsCollection, Tag
+  from troposphere.ec2 import LaunchTemplate, LaunchTemplateData
+  from troposphere.policies import AutoScalingRollingUpdate, UpdatePolicy
+  from export_registry import ALB_FULL_NAME, PRIVATE_SUBNETS, TARGET_GROUP, TARGET_GROUP_FULL_NAME
+  from asg_functions import albResourceLabel, createTargetTrackingPolicy, createWarmPool
+  from monitoring_functions import serviceSlo
+
+  # Scale out before the RequestCountPerTarget alarm of the service's SLO would fire.
+  slo = serviceSlo(service)
+
+  app_tier = Template()
+  app_tier.add_version("2010-09-09")
+  app_tier.add_description("Application tier stack. Contains the launch template and Auto Scaling group behind the target group.")
+
+  app_tier_network_stack_parameter = app_tier.add_parameter(
+    Parameter(
+      'NetworkStackName',
+      Description="Stack name containing the exported private subnets.",
+      Type="String"
+    )
+  )
+
+  app_tier_alb_stack_parameter = app_tier.add_parameter(
+    Parameter(
+      'ALBStackName',
+      Description="Stack name containing the exported ALB.",
+      Type="String"
+    )
+  )
+
+  app_tier_tg_stack_parameter = app_tier.add_parameter(
+    Parameter(
+      'TargetGroupStackName',
+      Description="Stack name containing the exported target group the instances register with.",
+      Type="String"
+    )
+  )
+
+  app_tier_image_parameter = app_tier.add_parameter(
+    Parameter(
+      'ImageId',
+      Description="AMI the instances are launched from.",
+      Type="AWS::EC2::Image::Id"
+    )
+  )
+
+  app_tier_instance_type_parameter = app_tier.add_parameter(
+    Parameter(
+      'InstanceType',
+      Default="m5.large",
+      Description="EC2 instance type of the application instances.",
+      Type="String"
+    )
+  )
+
+  app_tier_key_name_parameter = app_tier.add_parameter(
+    Parameter(
+      'KeyName',
+      Default="",
+      Description="EC2 key pair for SSH access. Leave empty for instances without one.",
+      Type="String"
+    )
+  )
+
+  app_tier_security_groups_parameter = app_tier.add_parameter(
+    Parameter(
+      'AppSecurityGroups',
+      Description="Security groups of the application instances.",
+      Type="List<AWS::EC2::SecurityGroup::Id>"
+    )
+  )
+
+  app_tier_min_size_parameter = app_tier.add_parameter(
+    Parameter(
+      'MinSize',
+      Default="2",
+      MinValue="1",
+      Description="Minimum number of instances in service.",
+      Type="Number"
+    )
+  )
+
+  app_tier_max_size_parameter = app_tier.add_parameter(
+    Parameter(
+      'MaxSize',
+      Default="12",
+      MinValue="1",
+      Description="Maximum number of instances in service.",
+      Type="Number"
+    )
+  )
+
+  app_tier_request_target_parameter = app_tier.add_parameter(
+    Parameter(
+      'RequestCountPerTargetTarget',
+      Default=str(int(slo['requests_per_target'] * 0.7)),
+      MinValue="1",
+      Description="Requests per instance per minute target tracking keeps the group at.",
+      Type="Number"
+    )
+  )
+
+  app_tier_cpu_target_parameter = app_tier.add_parameter(
+    Parameter(
+      'CPUUtilizationTarget',
+      Default="60",
+      MinValue="10",
+      MaxValue="90",
+      Description="Average CPU utilization in percent target tracking keeps the group at.",
+      Type="Number"
+    )
+  )
+
+  app_tier_warmup_parameter = app_tier.add_parameter(
+    Parameter(
+      'InstanceWarmup',
+      Default="300",
+      MinValue="0",
+      Description="Seconds until a new instance contributes to the scaling metrics. Also the health check grace period.",
+      Type="Number"
+    )
+  )
+
+  app_tier_batch_size_parameter = app_tier.add_parameter(
+    Parameter(
+      'RollingUpdateBatchSize',
+      Default="1",
+      MinValue="1",
+      Description="Instances replaced at a time when the launch template changes.",
+      Type="Number"
+    )
+  )
+
+  app_tier.add_condition("HasKeyName", Not(Equals(Ref(app_tier_key_name_parameter), "")))
+
+  app_tier_launch_template_resource = app_tier.add_resource(
+    LaunchTemplate(
+      "AppLaunchTemplate",
+      LaunchTemplateData=LaunchTemplateData(
+        ImageId=Ref(app_tier_image_parameter),
+        InstanceType=Ref(app_tier_instance_type_parameter),
+        KeyName=If("HasKeyName", Ref(app_tier_key_name_parameter), Ref("AWS::NoValue")),
+        SecurityGroupIds=Ref(app_tier_security_groups_parameter)
+      )
+    )
+  )
+
+  app_tier_asg_resource = app_tier.add_resource(
+    AutoScalingGroup(
+      "AppAutoScalingGroup",
+      LaunchTemplate=LaunchTemplateSpecification(
+        LaunchTemplateId=Ref(app_tier_launch_template_resource),
+        Version=GetAtt(app_tier_launch_template_resource, "LatestVersionNumber")
+      ),
+      MinSize=Ref(app_tier_min_size_parameter),
+      MaxSize=Ref(app_tier_max_size_parameter),
+      VPCZoneIdentifier=Split(",", PRIVATE_SUBNETS.importValue(app_tier_network_stack_parameter)),
+      TargetGroupARNs=[TARGET_GROUP.importValue(app_tier_tg_stack_parameter)],
+      HealthCheckType="ELB",
+      HealthCheckGracePeriod=Ref(app_tier_warmup_parameter),
+      MetricsCollection=[MetricsCollection(Granularity="1Minute")],
+      Tags=[Tag("Name", service, True)],
+      # A new launch template version replaces the instances in batches, keeping MinSize in service.
+      UpdatePolicy=UpdatePolicy(
+        AutoScalingRollingUpdate=AutoScalingRollingUpdate(
+          MaxBatchSize=Ref(app_tier_batch_size_parameter),
+          MinInstancesInService=Ref(app_tier_min_size_parameter),
+          PauseTime="PT5M",
+          SuspendProcesses=["AlarmNotification", "ScheduledActions"]
+        )
+      )
+    )
+  )
+
+  app_tier_request_policy_resource = createTargetTrackingPolicy(
+    app_tier, "AppRequestCountPolicy", app_tier_asg_resource, "ALBRequestCountPerTarget", Ref(app_tier_request_target_parameter),
+    resource_label=albResourceLabel(ALB_FULL_NAME.importValue(app_tier_alb_stack_parameter), TARGET_GROUP_FULL_NAME.importValue(app_tier_tg_stack_parameter)),
+    estimated_warmup=Ref(app_tier_warmup_parameter)
+  )
+
+  app_tier_cpu_policy_resource = createTargetTrackingPolicy(
+    app_tier, "AppCPUUtilizationPolicy", app_tier_asg_resource, "ASGAverageCPUUtilization", Ref(app_tier_cpu_target_parameter),
+    estimated_warmup=Ref(app_tier_warmup_parameter)
+  )
+
+  if warm_pool:
+    app_tier_warm_pool_parameter = app_tier.add_parameter(
+      Parameter(
+        'WarmPoolMinSize',
+        Default="1",
+        MinValue="0",
+        Description="Stopped, already initialized instances kept ready for scaling out.",
+        Type="Number"
+      )
+    )
+    app_tier_warm_pool_resource = createWarmPool(app_tier, "AppWarmPool", app_tier_asg_resource, Ref(app_tier_warm_pool_parameter))
+
+  return app_tier
+
+if __name__ == "__main__":
+  writeStack("AppTier")
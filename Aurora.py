@@ -1,158 +1,195 @@
-from troposphere import Template, Ref, Sub, ImportValue, Parameter, Select, GetAZs
-from troposphere.rds import DBCluster, DBInstance
-
-aurora = Template()
-aurora.add_version('2010-09-09')
-aurora.add_description('Aurora stack.')
-
-aurora_identifier_parameter = aurora.add_parameter(
-  Parameter(
-    'ClusterIdentifier',
-    Default="ucsd-edx-prod",
-    Description="Name that is unique for all DB instances owned by your AWS account in the current region.",
-    Type="String"
+from stack_registry import registerStack, writeStack
+
+@registerStack("Aurora", "aurora.yaml")
+def createAuroraTemplate(replicas=1, promotion_tiers=None, reader_scaling_metric="cpu"):
+  # The writer and replicas are AuroraClusterRDS01..NN. promotion_tiers has a tier (0-15, lower is
+  # promoted first) per instance and defaults to 0 for the writer and 1 for the replicas. Reader
+  # auto scaling adds replicas beyond these, see rds_functions; None for reader_scaling_metric
+  # turns it off.
+  from troposphere import Template, GetAtt, Ref, Parameter, Select, GetAZs
+  from troposphere.rds import DBCluster
+  from export_registry import RDS_SUBNET_GROUP, AURORA_ENDPOINT, AURORA_READER_ENDPOINT, AURORA_PORT
+  from rds_functions import DBInstance, READER_SCALING_METRICS, createAuroraReaderScaling
+
+  instances = replicas + 1
+  promotion_tiers = list(promotion_tiers) if promotion_tiers is not None else [0] + [1] * replicas
+  if len(promotion_tiers) != instances or not all(0 <= tier <= 15 for tier in promotion_tiers):
+    raise ValueError("Expected {} promotion tiers between 0 and 15, got {}".format(instances, promotion_tiers))
+
+  aurora = Template()
+  aurora.add_version('2010-09-09')
+  aurora.add_description('Aurora stack.')
+
+  aurora_identifier_parameter = aurora.add_parameter(
+    Parameter(
+      'ClusterIdentifier',
+      Default="ucsd-edx-prod",
+      Description="Name that is unique for all DB instances owned by your AWS account in the current region.",
+      Type="String"
+    )
   )
-)
-aurora_type_parameter = aurora.add_parameter(
-  Parameter(
-    'ClusterType',
-    Default="db.t2.medium",
-    AllowedValues=[
-      "db.r4.16xlarge", "db.r4.8xlarge", "db.r4.4xlarge", "db.r4.2xlarge", "db.r4.xlarge", "db.r4.large", "db.r3.8xlarge", "db.r3.4xlarge",
-      "db.r3.2xlarge", "db.r3.xlarge", "db.r3.large", "db.t2.medium", "db.t2.small"
-    ],
-    Type="String"
+  aurora_type_parameter = aurora.add_parameter(
+    Parameter(
+      'ClusterType',
+      Default="db.t2.medium",
+      AllowedValues=[
+        "db.r4.16xlarge", "db.r4.8xlarge", "db.r4.4xlarge", "db.r4.2xlarge", "db.r4.xlarge", "db.r4.large", "db.r3.8xlarge", "db.r3.4xlarge",
+        "db.r3.2xlarge", "db.r3.xlarge", "db.r3.large", "db.t2.medium", "db.t2.small"
+      ],
+      Type="String"
+    )
   )
-)
-
-aurora_db_engine_parameter = aurora.add_parameter(
-  Parameter(
-    'DBEngine',
-    Default="aurora",
-    Description="Default RDS database engine.",
-    Type="String"
-  )
-)
-
-aurora_db_engine_version_parameter = aurora.add_parameter(
-  Parameter(
-    'DBEngineVersion',
-    Default="5.6.10a",
-    Description="RDS engine version.",
-    Type="String",
-    AllowedValues=[ "5.6.10a", "5.7.12" ]
-  )
-)
-
-aurora_storage_encryption_parameter = aurora.add_parameter(
-  Parameter(
-    'EncryptionAtRest',
-    Default="False",
-    Description="Encrypt database storage.",
-    Type="String",
-    AllowedValues=[ "True", "False" ]
+
+  aurora_db_engine_parameter = aurora.add_parameter(
+    Parameter(
+      'DBEngine',
+      Default="aurora",
+      Description="Default RDS database engine.",
+      Type="String"
+    )
   )
-)
-
-aurora_public_parameter = aurora.add_parameter(
-  Parameter(
-    'PublicAccessibility',
-    Default="False",
-    Description="Make Aurora publically accessible.",
-    Type="String",
-    AllowedValues=[ "True", "False" ]
+
+  aurora_db_engine_version_parameter = aurora.add_parameter(
+    Parameter(
+      'DBEngineVersion',
+      Default="5.6.10a",
+      Description="RDS engine version.",
+      Type="String",
+      AllowedValues=[ "5.6.10a", "5.7.12" ]
+    )
   )
-)
-
-aurora_db_master_user_parameter = aurora.add_parameter(
-  Parameter(
-    'DBMasterUser',
-    Default="dbadmin",
-    Description="Default master username for RDS instance.",
-    Type="String"
+
+  aurora_storage_encryption_parameter = aurora.add_parameter(
+    Parameter(
+      'EncryptionAtRest',
+      Default="False",
+      Description="Encrypt database storage.",
+      Type="String",
+      AllowedValues=[ "True", "False" ]
+    )
   )
-)
-
-aurora_db_master_password_parameter = aurora.add_parameter(
-  Parameter(
-    'DBMasterPassword',
-    Default="",
-    Description="Default master password for RDS instance.",
-    NoEcho=True,
-    Type="String"
+
+  aurora_public_parameter = aurora.add_parameter(
+    Parameter(
+      'PublicAccessibility',
+      Default="False",
+      Description="Make Aurora publically accessible.",
+      Type="String",
+      AllowedValues=[ "True", "False" ]
+    )
   )
-)
-
-aurora_multiaz_parameter = aurora.add_parameter(
-  Parameter(
-    'MultiAZ',
-    Default="True",
-    AllowedValues=[ "True", "False" ],
-    Description="Setup RDS with Multi-AZ deployment.",
-    Type="String"
+
+  aurora_db_master_user_parameter = aurora.add_parameter(
+    Parameter(
+      'DBMasterUser',
+      Default="dbadmin",
+      Description="Default master username for RDS instance.",
+      Type="String"
+    )
   )
-)
 
-aurora_sec_group_parameter = aurora.add_parameter(
-  Parameter(
-    'SecurityGroups',
-    Description="RDS security group.",
-    Type="List<AWS::EC2::SecurityGroup::Id>"
+  aurora_db_master_password_parameter = aurora.add_parameter(
+    Parameter(
+      'DBMasterPassword',
+      Default="",
+      Description="Default master password for RDS instance.",
+      NoEcho=True,
+      Type="String"
+    )
   )
-)
-
-aurora_subnet_group_stack_parameter = aurora.add_parameter(
-  Parameter(
-    'NetworkStackName',
-    Default="",
-    Description="Stack name containing exported RDS subnet group.",
-    Type="String"
+
+  aurora_multiaz_parameter = aurora.add_parameter(
+    Parameter(
+      'MultiAZ',
+      Default="True",
+      AllowedValues=[ "True", "False" ],
+      Description="Setup RDS with Multi-AZ deployment.",
+      Type="String"
+    )
   )
-)
-
-aurora_subnet_group_name = "${" + aurora_subnet_group_stack_parameter.title + "}"+ "-" + "RDSSubnetGroup"
-
-aurora_cluster_resource = aurora.add_resource(
-  DBCluster(
-    "AuroraCluster",
-    AvailabilityZones=[ Select(0, GetAZs()), Select(1, GetAZs()), Select(2, GetAZs()) ],
-    DeletionPolicy="Snapshot",
-    Engine=Ref(aurora_db_engine_parameter),
-    EngineVersion=Ref(aurora_db_engine_version_parameter),
-    DBClusterIdentifier=Ref(aurora_identifier_parameter),
-    MasterUsername=Ref(aurora_db_master_user_parameter),
-    MasterUserPassword=Ref(aurora_db_master_password_parameter),
-    StorageEncrypted=Ref(aurora_storage_encryption_parameter),
-    DBSubnetGroupName=ImportValue(Sub(aurora_subnet_group_name)),
-    VpcSecurityGroupIds=Ref(aurora_sec_group_parameter)
+
+  aurora_sec_group_parameter = aurora.add_parameter(
+    Parameter(
+      'SecurityGroups',
+      Description="RDS security group.",
+      Type="List<AWS::EC2::SecurityGroup::Id>"
+    )
   )
-)
-
-aurora_cluster_rds01_resource = aurora.add_resource(
-  DBInstance(
-    "AuroraClusterRDS01",
-    DependsOn=aurora_cluster_resource,
-    DBInstanceClass=Ref(aurora_type_parameter),
-    Engine=Ref(aurora_db_engine_parameter),
-    EngineVersion=Ref(aurora_db_engine_version_parameter),
-    StorageEncrypted=Ref(aurora_storage_encryption_parameter),
-    PubliclyAccessible=Ref(aurora_public_parameter),
-    DBClusterIdentifier=Ref(aurora_identifier_parameter)
+
+  aurora_subnet_group_stack_parameter = aurora.add_parameter(
+    Parameter(
+      'NetworkStackName',
+      Default="",
+      Description="Stack name containing exported RDS subnet group.",
+      Type="String"
+    )
   )
-)
-
-aurora_cluster_rds02_resource = aurora.add_resource(
-  DBInstance(
-    "AuroraClusterRDS02",
-    DependsOn=aurora_cluster_resource,
-    DBInstanceClass=Ref(aurora_type_parameter),
-    Engine=Ref(aurora_db_engine_parameter),
-    EngineVersion=Ref(aurora_db_engine_version_parameter),
-    StorageEncrypted=Ref(aurora_storage_encryption_parameter),
-    PubliclyAccessible=Ref(aurora_public_parameter),
-    DBClusterIdentifier=Ref(aurora_identifier_parameter)
+
+  aurora_cluster_resource = aurora.add_resource(
+    DBCluster(
+      "AuroraCluster",
+      AvailabilityZones=[ Select(0, GetAZs()), Select(1, GetAZs()), Select(2, GetAZs()) ],
+      DeletionPolicy="Snapshot",
+      Engine=Ref(aurora_db_engine_parameter),
+      EngineVersion=Ref(aurora_db_engine_version_parameter),
+      DBClusterIdentifier=Ref(aurora_identifier_parameter),
+      MasterUsername=Ref(aurora_db_master_user_parameter),
+      MasterUserPassword=Ref(aurora_db_master_password_parameter),
+      StorageEncrypted=Ref(aurora_storage_encryption_parameter),
+      DBSubnetGroupName=RDS_SUBNET_GROUP.importValue(aurora_subnet_group_stack_parameter),
+      VpcSecurityGroupIds=Ref(aurora_sec_group_parameter)
+    )
   )
-)
 
-with open("aurora.yaml", "w") as file:
-  file.write(aurora.to_yaml())
+  aurora_instance_resources = []
+  for index, tier in enumerate(promotion_tiers):
+    aurora_instance_resources.append(aurora.add_resource(
+      DBInstance(
+        "AuroraClusterRDS%02d" % (index + 1),
+        DependsOn=aurora_cluster_resource,
+        DBInstanceClass=Ref(aurora_type_parameter),
+        Engine=Ref(aurora_db_engine_parameter),
+        EngineVersion=Ref(aurora_db_engine_version_parameter),
+        StorageEncrypted=Ref(aurora_storage_encryption_parameter),
+        PubliclyAccessible=Ref(aurora_public_parameter),
+        DBClusterIdentifier=Ref(aurora_identifier_parameter),
+        PromotionTier=tier
+      )
+    ))
+
+  if reader_scaling_metric is not None:
+    aurora_reader_max_parameter = aurora.add_parameter(
+      Parameter(
+        'ReaderMaxCapacity',
+        Default=str(min(replicas + 4, 15)),
+        MinValue=str(replicas),
+        MaxValue="15",
+        Description="Maximum number of Aurora Replicas reader auto scaling scales out to.",
+        Type="Number"
+      )
+    )
+
+    aurora_reader_target_parameter = aurora.add_parameter(
+      Parameter(
+        'ReaderScalingTarget',
+        Default=str(READER_SCALING_METRICS[reader_scaling_metric][1]),
+        Description="Average " + READER_SCALING_METRICS[reader_scaling_metric][0] + " of the readers auto scaling keeps the cluster at.",
+        Type="Number"
+      )
+    )
+
+    aurora_reader_scaling_resources = createAuroraReaderScaling(
+      aurora, aurora_cluster_resource, replicas, Ref(aurora_reader_max_parameter), reader_scaling_metric, Ref(aurora_reader_target_parameter),
+      replica_resources=aurora_instance_resources
+    )
+
+  aurora_endpoint_output = aurora.add_output(AURORA_ENDPOINT.output(GetAtt(aurora_cluster_resource, "Endpoint.Address")))
+
+  aurora_reader_endpoint_output = aurora.add_output(AURORA_READER_ENDPOINT.output(GetAtt(aurora_cluster_resource, "ReadEndpoint.Address")))
+
+  aurora_port_output = aurora.add_output(AURORA_PORT.output(GetAtt(aurora_cluster_resource, "Endpoint.Port")))
+
+  return aurora
+
+if __name__ == "__main__":
+  writeStack("Aurora")
@@ -1,116 +1,160 @@
-from troposphere import Template, Ref
-from troposphere.ec2 import SecurityGroup, SecurityGroupRule
-from vpc_functions import createVPC, createPublicNetworks, createPrivateNetworks
-from rds_functions import createRDSSubnetGroup
-from elasticache_functions import createElastiCacheSubnetGroup
-
-base_network = Template()
-base_network.add_version('2010-09-09')
-base_network.add_description('Base network template. VPC, networks, Security Groups, Subnet Groups and NAT gateways.')
-
-vpc_parameter, vpc_resource = createVPC(base_network, 'VPC', '192.168.0.0/20')
-public_subnet_parameters, public_subnet_resources = createPublicNetworks(base_network, vpc_parameter, vpc_resource, 3)
-private_subnet_parameters, private_subnet_resources = createPrivateNetworks(base_network, vpc_parameter, vpc_resource, 3)
-
-# rds_subnet_group_resource, rds_subnet_group_output  = createRDSSubnetGroup(base_network, private_subnet_resources)
-# elasticache_subnet_group_resource, elasticache_subnet_group_output = createElastiCacheSubnetGroup(base_network, private_subnet_resources)
-
-# bastion_security_group = base_network.add_resource(
-#   SecurityGroup(
-#     'UCSDBastionSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for Bastion instance',
-#     SecurityGroupIngress=[
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='22', ToPort='22', CidrIp='0.0.0.0/0'
-#       )
-#     ]
-#   )
-# )
-
-# edx_alb_security_group = base_network.add_resource(
-#   SecurityGroup(
-#     'UCSDedXALBSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for Application Load Balancer standing in front of edX instances',
-#     SecurityGroupIngress=[
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='80', ToPort='80', CidrIp='0.0.0.0/0'
-#       ),
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='443', ToPort='443', CidrIp='0.0.0.0/0'
-#       )
-#     ]
-#   )
-# )
-
-# edx_security_group = base_network.add_resource(
-#   SecurityGroup(
-#     'UCSDedXSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all edX instances',
-#     SecurityGroupIngress=[
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='80', ToPort='80', SourceSecurityGroupId=Ref(edx_alb_security_group)
-#       ),
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='22', ToPort='22', SourceSecurityGroupId=Ref(bastion_security_group)
-#       )
-#     ]
-#   )
-# )
-
-# mongodb_security_group = base_network.add_resource(
-#   SecurityGroup(
-#     'UCSDMongoDBSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all MongoDB instances',
-#     SecurityGroupIngress=[
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='27017', ToPort='27017', SourceSecurityGroupId=Ref(edx_security_group)
-#       ),
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='22', ToPort='22', SourceSecurityGroupId=Ref(bastion_security_group)
-#       )
-#     ]
-#   )
-# )
-
-# rds_security_group = base_network.add_resource(
-#   SecurityGroup(
-#     'UCSDRDSSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all edX instances',
-#     SecurityGroupIngress=[
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='3306', ToPort='3306', SourceSecurityGroupId=Ref(edx_security_group)
-#       )
-#     ]
-#   )
-# )
-
-# redis_security_group = base_network.add_resource(
-#   SecurityGroup(
-#     'UCSDRedisSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all Redis instances',
-#     SecurityGroupIngress=[
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='6379', ToPort='6379', SourceSecurityGroupId=Ref(edx_security_group)
-#       )
-#     ]
-#   )
-# )
-
-# memcached_security_group = base_network.add_resource(
-#   SecurityGroup(
-#     'UCSDMemcachedSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all Memcached instances',
-#     SecurityGroupIngress=[
-#       SecurityGroupRule(
-#         IpProtocol='tcp', FromPort='11211', ToPort='11211', SourceSecurityGroupId=Ref(edx_security_group)
-#       )
-#     ]
-#   )
-# )
-
-# elasticsearch_security_group = base_network.add_resource(
-#   SecurityGroup(
-#     'UCSDElasticsearchSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all Memcached instances',
-#     SecurityGroupIngress=[
-#       SecurityGroupRule(
-#         IpProtocol='-1', SourceSecurityGroupId=Ref(edx_security_group)
-#       )
-#     ]
-#   )
-# ) 
-
-with open("BaseVPCNetwork.yaml", "w") as file:
-  file.write(base_network.to_yaml())
+import os
+from stack_registry import ROOT, registerStack, writeStack
+
+# Subnets of the deployed stack, {vpc cidr: {tier: [subnet per AZ]}}. Rendering only reads it; after
+# a deploy record the deployed template with --record-allocation and commit the file.
+ALLOCATION_FILE = 'BaseVPCNetwork.subnets.json'
+# AZs a layout planned from scratch is sized for, so AZs can be added up to this count without
+# replacing subnets. Subnets of a recorded allocation always stay where they are.
+RESERVE_AZS = 6
+
+@registerStack("BaseVPCNetwork", "BaseVPCNetwork.yaml", inputs=[ALLOCATION_FILE])
+def createBaseVPCNetworkTemplate(allocation_file=os.path.join(ROOT, ALLOCATION_FILE), reserve_azs=RESERVE_AZS, nat_mode="per-tier-az", nat_in_public_subnets=None, endpoint_services=("s3", "dynamodb")):
+  from troposphere import Template, Join, Ref
+  from troposphere.ec2 import SecurityGroup, SecurityGroupRule
+  from vpc_functions import createVPC, createPublicNetworks, createPrivateNetworks, loadSubnetAllocation, planSubnetsIncremental, NatTopology, createVPCEndpoints
+  from rds_functions import createRDSSubnetGroup
+  from elasticache_functions import createElastiCacheSubnetGroup
+  from export_registry import PRIVATE_SUBNETS
+
+  base_network = Template()
+  base_network.add_version('2010-09-09')
+  base_network.add_description('Base network template. VPC, networks, Security Groups, Subnet Groups and NAT gateways.')
+
+  regions_count = 3
+  vpc_parameter, vpc_resource = createVPC(base_network, 'VPC', '192.168.0.0/20')
+
+  # Keep the subnets recorded in the allocation file in place so adding AZs does not replace them.
+  # Delete the allocation file to plan the layout from scratch.
+  previous_allocation = loadSubnetAllocation(allocation_file) if os.path.exists(allocation_file) else {}
+  subnet_plan = planSubnetsIncremental(vpc_parameter.properties['Default'], regions_count, previous_allocation, reserve_azs=reserve_azs)
+  public_subnet_parameters, public_subnet_resources = createPublicNetworks(base_network, vpc_parameter, vpc_resource, regions_count, subnets=subnet_plan['public'])
+  # See NatTopology for the modes; "per-az" shares one NAT gateway per AZ between tiers and keeps traffic in its AZ.
+  # NAT gateways stay in the private subnets of per-tier-az, as deployed, and go into the public
+  # subnets for the modes that share them unless nat_in_public_subnets says otherwise.
+  if nat_in_public_subnets is None:
+    nat_in_public_subnets = nat_mode != "per-tier-az"
+  nat_topology = NatTopology(nat_mode, public_subnet_resources if nat_in_public_subnets else None)
+  private_subnet_parameters, private_subnet_resources = createPrivateNetworks(base_network, vpc_parameter, vpc_resource, regions_count, subnets=subnet_plan['private'], nat_topology=nat_topology)
+
+  # S3 and DynamoDB traffic goes through gateway endpoints instead of the NAT gateways.
+  createVPCEndpoints(base_network, vpc_parameter, vpc_resource, endpoint_services, private_subnet_resources)
+
+  rds_subnet_group_resource, rds_subnet_group_output  = createRDSSubnetGroup(base_network, private_subnet_resources)
+  elasticache_subnet_group_resource, elasticache_subnet_group_output = createElastiCacheSubnetGroup(base_network, private_subnet_resources)
+
+  # Comma separated for Fn::Split in the stacks that place instances in the private subnets.
+  private_subnets_output = base_network.add_output(PRIVATE_SUBNETS.output(Join(",", [Ref(subnet) for subnet in private_subnet_resources])))
+
+  # bastion_security_group = base_network.add_resource(
+  #   SecurityGroup(
+  #     'UCSDBastionSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for Bastion instance',
+  #     SecurityGroupIngress=[
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='22', ToPort='22', CidrIp='0.0.0.0/0'
+  #       )
+  #     ]
+  #   )
+  # )
+
+  # edx_alb_security_group = base_network.add_resource(
+  #   SecurityGroup(
+  #     'UCSDedXALBSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for Application Load Balancer standing in front of edX instances',
+  #     SecurityGroupIngress=[
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='80', ToPort='80', CidrIp='0.0.0.0/0'
+  #       ),
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='443', ToPort='443', CidrIp='0.0.0.0/0'
+  #       )
+  #     ]
+  #   )
+  # )
+
+  # edx_security_group = base_network.add_resource(
+  #   SecurityGroup(
+  #     'UCSDedXSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all edX instances',
+  #     SecurityGroupIngress=[
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='80', ToPort='80', SourceSecurityGroupId=Ref(edx_alb_security_group)
+  #       ),
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='22', ToPort='22', SourceSecurityGroupId=Ref(bastion_security_group)
+  #       )
+  #     ]
+  #   )
+  # )
+
+  # mongodb_security_group = base_network.add_resource(
+  #   SecurityGroup(
+  #     'UCSDMongoDBSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all MongoDB instances',
+  #     SecurityGroupIngress=[
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='27017', ToPort='27017', SourceSecurityGroupId=Ref(edx_security_group)
+  #       ),
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='22', ToPort='22', SourceSecurityGroupId=Ref(bastion_security_group)
+  #       )
+  #     ]
+  #   )
+  # )
+
+  # rds_security_group = base_network.add_resource(
+  #   SecurityGroup(
+  #     'UCSDRDSSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all edX instances',
+  #     SecurityGroupIngress=[
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='3306', ToPort='3306', SourceSecurityGroupId=Ref(edx_security_group)
+  #       )
+  #     ]
+  #   )
+  # )
+
+  # redis_security_group = base_network.add_resource(
+  #   SecurityGroup(
+  #     'UCSDRedisSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all Redis instances',
+  #     SecurityGroupIngress=[
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='6379', ToPort='6379', SourceSecurityGroupId=Ref(edx_security_group)
+  #       )
+  #     ]
+  #   )
+  # )
+
+  # memcached_security_group = base_network.add_resource(
+  #   SecurityGroup(
+  #     'UCSDMemcachedSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all Memcached instances',
+  #     SecurityGroupIngress=[
+  #       SecurityGroupRule(
+  #         IpProtocol='tcp', FromPort='11211', ToPort='11211', SourceSecurityGroupId=Ref(edx_security_group)
+  #       )
+  #     ]
+  #   )
+  # )
+
+  # elasticsearch_security_group = base_network.add_resource(
+  #   SecurityGroup(
+  #     'UCSDElasticsearchSecGroup', VpcId=Ref(vpc_resource), GroupDescription='Security group for all Memcached instances',
+  #     SecurityGroupIngress=[
+  #       SecurityGroupRule(
+  #         IpProtocol='-1', SourceSecurityGroupId=Ref(edx_security_group)
+  #       )
+  #     ]
+  #   )
+  # ) 
+
+  return base_network
+
+if __name__ == "__main__":
+  import argparse
+  from template_graph import loadTemplateFile
+  from vpc_functions import natTopologyReport, saveSubnetAllocation, subnetAllocationFromTemplate
+  parser = argparse.ArgumentParser(description='Render the BaseVPCNetwork stack.')
+  parser.add_argument('--record-allocation', metavar='TEMPLATE', help='Write the subnets of the deployed template TEMPLATE to {} instead of rendering.'.format(ALLOCATION_FILE))
+  args = parser.parse_args()
+  if args.record_allocation:
+    saveSubnetAllocation(os.path.join(ROOT, ALLOCATION_FILE), subnetAllocationFromTemplate(loadTemplateFile(args.record_allocation)))
+    raise SystemExit(0)
+  path = writeStack("BaseVPCNetwork")[0]
+  report = natTopologyReport(loadTemplateFile(path))
+  print("{}: {} route tables, {} NAT gateways, {} subnets routed through a NAT gateway in another AZ".format(path, report['route_tables'], report['nat_gateways'], len(report['cross_az_subnets'])))
@@ -0,0 +1,126 @@
+from troposphere import Equals, Ref, Template as TroposphereTemplate
+from troposphere.elasticloadbalancingv2 import Action, Condition, ListenerRule, TargetGroupAttribute
+
+if hasattr(TroposphereTemplate, 'add_rule'):
+  Template = TroposphereTemplate
+else:
+  # Older troposphere releases, the pinned 2.3.4 among them, do not write template Rules.
+  class Template(TroposphereTemplate):
+
+    def __init__(self, *args, **kwargs):
+      super(Template, self).__init__(*args, **kwargs)
+      self.rules = {}
+
+    def add_rule(self, name, rule):
+      if name in self.rules:
+        raise ValueError('duplicate key "{}" detected'.format(name))
+      self.rules[name] = rule
+
+    def to_dict(self):
+      from troposphere import encode_to_dict
+      template_data = super(Template, self).to_dict()
+      if self.rules:
+        template_data['Rules'] = encode_to_dict(self.rules)
+      return template_data
+
+# Target group tuning. A profile sets the health check thresholds and the target group attributes
+# that decide how fast targets enter and leave service:
+#   deregistration_delay  seconds in-flight requests get to finish before a target is removed
+#   slow_start            seconds over which a new target's share of requests ramps up, 0 is off
+#   algorithm             round_robin or least_outstanding_requests
+#   stickiness            lb_cookie duration in seconds, 0 is off
+# The ALB does not support slow start together with least_outstanding_requests.
+
+ROUND_ROBIN = 'round_robin'
+LEAST_OUTSTANDING_REQUESTS = 'least_outstanding_requests'
+
+DEFAULT_TARGET_GROUP_PROFILE = {
+  'health_check_interval': 30,
+  'health_check_timeout': 10,
+  'healthy_threshold': 5,
+  'unhealthy_threshold': 2,
+  'deregistration_delay': 30,
+  'slow_start': 0,
+  'algorithm': ROUND_ROBIN,
+  'stickiness': 0,
+}
+
+TARGET_GROUP_PROFILES = {
+  'default': {},
+  # Detect failed targets and put new ones into service as fast as health checks allow.
+  'fast-failover': {'health_check_interval': 10, 'health_check_timeout': 5, 'healthy_threshold': 2, 'unhealthy_threshold': 2, 'deregistration_delay': 10, 'algorithm': LEAST_OUTSTANDING_REQUESTS},
+  # Uploads, exports and other slow requests: route by outstanding requests and let them drain.
+  'long-requests': {'healthy_threshold': 3, 'deregistration_delay': 600, 'algorithm': LEAST_OUTSTANDING_REQUESTS},
+  # Targets that are slow until their caches are warm get a gradually increasing share of requests.
+  'warm-up': {'healthy_threshold': 3, 'deregistration_delay': 60, 'slow_start': 120},
+}
+
+def targetGroupProfile(name, **overrides):
+  if name not in TARGET_GROUP_PROFILES:
+    raise ValueError("Unknown target group profile {}, expected one of {}".format(name, ", ".join(sorted(TARGET_GROUP_PROFILES))))
+  profile = dict(DEFAULT_TARGET_GROUP_PROFILE, **TARGET_GROUP_PROFILES[name])
+  profile.update(overrides)
+  if profile['algorithm'] not in (ROUND_ROBIN, LEAST_OUTSTANDING_REQUESTS):
+    raise ValueError("Unknown load balancing algorithm {}".format(profile['algorithm']))
+  if profile['slow_start'] and profile['algorithm'] == LEAST_OUTSTANDING_REQUESTS:
+    raise ValueError("Slow start can not be combined with the least_outstanding_requests algorithm")
+  if profile['slow_start'] and not 30 <= profile['slow_start'] <= 900:
+    raise ValueError("Slow start must be 0 or between 30 and 900 seconds, got {}".format(profile['slow_start']))
+  return profile
+
+# SlowStartDuration parameter values: 0, or 30 to 900 seconds.
+SLOW_START_PATTERN = '0|[3-9][0-9]|[1-8][0-9]{2}|900'
+
+def createTargetGroupRules(template, slow_start, algorithm):
+  # The profile checks of targetGroupProfile for the values the parameters get at deploy time.
+  # slow_start and algorithm are the SlowStartDuration and LoadBalancingAlgorithm parameters.
+  return template.add_rule(
+    "SlowStartAlgorithmRule",
+    {
+      'RuleCondition': Equals(Ref(algorithm), LEAST_OUTSTANDING_REQUESTS),
+      'Assertions': [{
+        'Assert': Equals(Ref(slow_start), "0"),
+        'AssertDescription': "Slow start can not be combined with the least_outstanding_requests algorithm, set SlowStartDuration to 0."
+      }]
+    }
+  )
+
+def createTargetGroupAttributes(deregistration_delay, slow_start, algorithm, stickiness_enabled, stickiness_duration):
+  # Values are strings or Refs to the parameters that carry them.
+  return [
+    TargetGroupAttribute(Key="deregistration_delay.timeout_seconds", Value=deregistration_delay),
+    TargetGroupAttribute(Key="slow_start.duration_seconds", Value=slow_start),
+    TargetGroupAttribute(Key="load_balancing.algorithm.type", Value=algorithm),
+    TargetGroupAttribute(Key="stickiness.enabled", Value=stickiness_enabled),
+    TargetGroupAttribute(Key="stickiness.type", Value="lb_cookie"),
+    TargetGroupAttribute(Key="stickiness.lb_cookie.duration_seconds", Value=stickiness_duration),
+  ]
+
+def createListenerRules(template, listener, rules, target_group_arns, prefix=None):
+  # Adds a ListenerRule per rule compiled by listener_rules.compileListenerRules, named
+  # <listener>RuleNN in priority order. target_group_arns maps rule targets to target group ARNs.
+  # The priority 1 rule is named <listener>Rule, the listener's single rule before rules were
+  # compiled: a new resource at the priority the old one still holds fails to create.
+  prefix = prefix or listener.title + "Rule"
+  resources = []
+  for rule in rules:
+    conditions = []
+    if rule.hosts:
+      conditions.append(Condition(Field="host-header", Values=rule.hosts))
+    if rule.paths:
+      conditions.append(Condition(Field="path-pattern", Values=rule.paths))
+    resources.append(template.add_resource(
+      ListenerRule(
+        prefix if rule.priority == 1 else "{}{:02d}".format(prefix, rule.priority),
+        ListenerArn=Ref(listener),
+        Conditions=conditions,
+        Actions=[
+          Action(
+            Type="forward",
+            TargetGroupArn=target_group_arns[rule.target]
+          )
+        ],
+        Priority=rule.priority
+      )
+    ))
+  return resources
@@ -0,0 +1,303 @@
+import argparse
+import csv
+import datetime
+import glob
+import gzip
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from listener_rules import compileListenerRules, matchRoute, routeKey
+
+# Reads the access logs the ALB writes to S3 (copied to a local directory) and summarizes them per
+# host, path prefix, target group and listener route: request rates, 5xx ratios and p50/p95/p99 of
+# the request, target and response processing times. Every log file is streamed line by line in a
+# worker process into a summary of fixed size per group, and the summaries are merged as workers
+# finish, so memory does not grow with the amount of logs.
+# Percentiles come from QuantileSketch, a log-bucketed histogram with a bounded relative error
+# (DDSketch) that merges exactly. The per route request counts can be written as the hit-count file
+# listeners.py orders its listener rules by, and the target group percentiles give the values
+# recommend() proposes for the TargetGroup and ALB timeout parameters.
+
+TIMINGS = ['request', 'target', 'response']
+DIMENSIONS = ['host', 'path', 'target_group', 'route']
+QUANTILES = [0.5, 0.95, 0.99]
+DEFAULT_ROUTE = '(default)'
+
+# Fields of an ALB access log entry, see "Access logs for your Application Load Balancer".
+FIELD_TIME = 1
+FIELD_REQUEST_PROCESSING_TIME = 5
+FIELD_TARGET_PROCESSING_TIME = 6
+FIELD_RESPONSE_PROCESSING_TIME = 7
+FIELD_ELB_STATUS_CODE = 8
+FIELD_TARGET_STATUS_CODE = 9
+FIELD_REQUEST = 12
+FIELD_TARGET_GROUP_ARN = 16
+
+class QuantileSketch(object):
+  # Quantiles within relative_accuracy of the exact value. Values fall in buckets with bounds
+  # gamma**(index - 1) < value <= gamma**index; beyond max_buckets the lowest buckets are collapsed,
+  # which only costs accuracy at the low end.
+
+  def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+    self.relative_accuracy = relative_accuracy
+    self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    self.log_gamma = math.log(self.gamma)
+    self.max_buckets = max_buckets
+    self.buckets = {}
+    self.zero_count = 0
+    self.count = 0
+    self.maximum = 0.0
+
+  def add(self, value, count=1):
+    self.count += count
+    self.maximum = max(self.maximum, value)
+    if value <= 0:
+      self.zero_count += count
+      return
+    index = int(math.ceil(math.log(value) / self.log_gamma))
+    self.buckets[index] = self.buckets.get(index, 0) + count
+    if len(self.buckets) > self.max_buckets:
+      self._collapse()
+
+  def _collapse(self):
+    indexes = sorted(self.buckets)
+    excess = indexes[:len(indexes) - self.max_buckets + 1]
+    self.buckets[excess[-1]] += sum(self.buckets.pop(index) for index in excess[:-1])
+
+  def merge(self, other):
+    if other.gamma != self.gamma:
+      raise ValueError("Can not merge sketches with relative accuracy {} and {}".format(self.relative_accuracy, other.relative_accuracy))
+    for index, count in other.buckets.items():
+      self.buckets[index] = self.buckets.get(index, 0) + count
+    self.zero_count += other.zero_count
+    self.count += other.count
+    self.maximum = max(self.maximum, other.maximum)
+    if len(self.buckets) > self.max_buckets:
+      self._collapse()
+
+  def quantile(self, q):
+    if not self.count:
+      return None
+    rank = q * (self.count - 1)
+    seen = self.zero_count
+    if rank < seen:
+      return 0.0
+    for index in sorted(self.buckets):
+      seen += self.buckets[index]
+      if rank < seen:
+        return min(2 * self.gamma ** index / (self.gamma + 1), self.maximum)
+    return self.maximum
+
+def percentiles(sketch):
+  values = dict(('p{}'.format(int(q * 100)), sketch.quantile(q)) for q in QUANTILES)
+  values['max'] = sketch.maximum if sketch.count else None
+  return values
+
+class GroupStats(object):
+
+  def __init__(self):
+    self.count = 0
+    self.elb_5xx = 0
+    self.target_5xx = 0
+    self.target_errors = 0
+    self.first = None
+    self.last = None
+    self.timings = dict((timing, QuantileSketch()) for timing in TIMINGS)
+
+  def add(self, timestamp, timings, elb_status, target_status):
+    # timings are seconds or -1 when the ALB could not dispatch the request or the target did not
+    # respond; those entries only count toward the error ratios.
+    self.count += 1
+    if self.first is None or timestamp < self.first:
+      self.first = timestamp
+    if self.last is None or timestamp > self.last:
+      self.last = timestamp
+    if elb_status.startswith('5'):
+      self.elb_5xx += 1
+    if target_status.startswith('5'):
+      self.target_5xx += 1
+    if timings[1] < 0:
+      self.target_errors += 1
+    for timing, value in zip(TIMINGS, timings):
+      if value >= 0:
+        self.timings[timing].add(value)
+
+  def merge(self, other):
+    self.count += other.count
+    self.elb_5xx += other.elb_5xx
+    self.target_5xx += other.target_5xx
+    self.target_errors += other.target_errors
+    firsts = [value for value in (self.first, other.first) if value is not None]
+    lasts = [value for value in (self.last, other.last) if value is not None]
+    self.first = min(firsts) if firsts else None
+    self.last = max(lasts) if lasts else None
+    for timing in TIMINGS:
+      self.timings[timing].merge(other.timings[timing])
+
+  def seconds(self):
+    # Timestamps are ISO 8601 in UTC, so they compare as strings and are only parsed here.
+    if self.first is None:
+      return 0.0
+    parse = lambda value: datetime.datetime.strptime(value[:26].rstrip('Z'), '%Y-%m-%dT%H:%M:%S.%f')
+    return (parse(self.last) - parse(self.first)).total_seconds()
+
+  def report(self):
+    seconds = self.seconds()
+    return {
+      'requests': self.count,
+      'requests_per_second': round(self.count / seconds, 3) if seconds > 0 else None,
+      'elb_5xx_ratio': round(float(self.elb_5xx) / self.count, 5) if self.count else 0.0,
+      'target_5xx_ratio': round(float(self.target_5xx) / self.count, 5) if self.count else 0.0,
+      'target_error_ratio': round(float(self.target_errors) / self.count, 5) if self.count else 0.0,
+      'seconds': dict((timing, percentiles(sketch)) for timing, sketch in self.timings.items()),
+    }
+
+def parseRequest(request):
+  # (host, path) of an ALB request field such as "GET https://example.com:443/a/b?c=d HTTP/1.1".
+  parts = request.split(' ')
+  url = parts[1] if len(parts) > 1 else ''
+  _, _, rest = url.partition('://')
+  authority, slash, path = rest.partition('/')
+  host = authority.rsplit(':', 1)[0] if ':' in authority and not authority.endswith(']') else authority
+  return host.lower(), slash + path.split('?', 1)[0]
+
+def pathPrefix(path, depth):
+  # The first depth segments of path: '/api/v1/x' is '/api/' for depth 1.
+  segments = path.split('/')
+  if len(segments) <= depth + 1:
+    return path
+  return '/'.join(segments[:depth + 1]) + '/'
+
+def targetGroupName(arn):
+  # arn:...:targetgroup/<name>/<id>, or '-' for requests the ALB answered itself.
+  parts = arn.split('/')
+  return parts[1] if len(parts) == 3 else arn
+
+def openLog(path):
+  if path.endswith('.gz'):
+    return gzip.open(path, 'rt')
+  return open(path)
+
+def analyzeFile(path, rules=(), path_depth=1):
+  # {(dimension, value): GroupStats} for one log file. rules are compiled listener rules the
+  # requests are matched against for the route dimension.
+  summary = {}
+  with openLog(path) as file:
+    for fields in csv.reader(file, delimiter=' ', quotechar='"'):
+      if len(fields) <= FIELD_TARGET_GROUP_ARN:
+        continue
+      try:
+        timings = [float(fields[index]) for index in (FIELD_REQUEST_PROCESSING_TIME, FIELD_TARGET_PROCESSING_TIME, FIELD_RESPONSE_PROCESSING_TIME)]
+      except ValueError:
+        continue
+      host, path_value = parseRequest(fields[FIELD_REQUEST])
+      route = matchRoute(rules, host, path_value) if rules else None
+      for key in (('host', host), ('path', pathPrefix(path_value, path_depth)), ('target_group', targetGroupName(fields[FIELD_TARGET_GROUP_ARN])), ('route', routeKey(route) if route else DEFAULT_ROUTE)):
+        stats = summary.get(key)
+        if stats is None:
+          stats = summary[key] = GroupStats()
+        stats.add(fields[FIELD_TIME], timings, fields[FIELD_ELB_STATUS_CODE], fields[FIELD_TARGET_STATUS_CODE])
+  return summary
+
+def mergeSummaries(summary, other):
+  for key, stats in other.items():
+    if key in summary:
+      summary[key].merge(stats)
+    else:
+      summary[key] = stats
+  return summary
+
+def logFiles(directory):
+  return sorted(path for pattern in ('*.log', '*.log.gz') for path in glob.glob(os.path.join(directory, '**', pattern), recursive=True))
+
+def analyzeDirectory(directory, routes=(), path_depth=1, jobs=None):
+  # Summary of every log file below directory, analyzed in parallel.
+  rules = compileListenerRules(list(routes)) if routes else []
+  summary = {}
+  with ProcessPoolExecutor(max_workers=jobs) as executor:
+    futures = [executor.submit(analyzeFile, path, rules, path_depth) for path in logFiles(directory)]
+    for future in as_completed(futures):
+      mergeSummaries(summary, future.result())
+  return summary
+
+def hitCounts(summary):
+  # {routeKey: requests} in the format listener_rules.loadHitCounts reads.
+  return dict((value, stats.count) for (dimension, value), stats in summary.items() if dimension == 'route' and value != DEFAULT_ROUTE)
+
+def recommend(summary, profile='default'):
+  # {target group: {parameter: value}} for the TargetGroup stack parameters of a target group
+  # deployed with the given profile, and the ALB's IdleTimeout under the '*' key when the slowest
+  # requests come close to the default.
+  #   DelayTimeout            draining waits for twice the p99 target time, at least 5 seconds
+  #   HealthCheckTimeout      twice the p99 target time within 5-120 seconds, below the interval
+  #   LoadBalancingAlgorithm  least_outstanding_requests when p99 is more than 10x p50 and over 1s,
+  #                           unless the profile uses slow start, which the ALB can not combine with it
+  from alb_functions import ROUND_ROBIN, LEAST_OUTSTANDING_REQUESTS, targetGroupProfile
+  slow_start = targetGroupProfile(profile)['slow_start']
+  recommendations = {}
+  slowest = 0.0
+  for (dimension, name), stats in sorted(summary.items()):
+    sketch = stats.timings['target']
+    if dimension != 'target_group' or name == '-' or not sketch.count:
+      continue
+    p50, p99 = sketch.quantile(0.5), sketch.quantile(0.99)
+    slowest = max(slowest, sketch.maximum)
+    timeout = min(max(5, int(math.ceil(p99 * 2))), 120)
+    algorithm = LEAST_OUTSTANDING_REQUESTS if p99 > 1 and p99 > 10 * p50 and not slow_start else ROUND_ROBIN
+    # Raises if the recommendation would not be a valid target group configuration.
+    targetGroupProfile(profile, health_check_timeout=timeout, algorithm=algorithm)
+    recommendations[name] = {
+      'DelayTimeout': str(min(max(5, int(math.ceil(p99 * 2))), 3600)),
+      'HealthCheckTimeout': str(timeout),
+      'HealthCheckInterval': str(max(30, timeout + 5)),
+      'LoadBalancingAlgorithm': algorithm,
+    }
+  if slowest > 50:
+    recommendations['*'] = {'IdleTimeout': str(min(int(math.ceil(slowest * 1.2)), 4000))}
+  return recommendations
+
+def formatSeconds(value):
+  return '-' if value is None else '{:.3f}'.format(value)
+
+def printSummary(summary, dimensions=DIMENSIONS, limit=20):
+  for dimension in dimensions:
+    groups = sorted(((value, stats) for (group_dimension, value), stats in summary.items() if group_dimension == dimension), key=lambda item: -item[1].count)
+    if not groups:
+      continue
+    print('{:<40} {:>9} {:>8} {:>7} {:>7} {:>7} {:>7} {:>7}'.format(dimension, 'requests', 'req/s', 'elb5xx', 'tgt5xx', 'p50', 'p95', 'p99'))
+    for value, stats in groups[:limit]:
+      report = stats.report()
+      target = report['seconds']['target']
+      print('{:<40} {:>9} {:>8} {:>7.2%} {:>7.2%} {:>7} {:>7} {:>7}'.format(value[:40], report['requests'], '-' if report['requests_per_second'] is None else '{:.2f}'.format(report['requests_per_second']), report['elb_5xx_ratio'], report['target_5xx_ratio'], formatSeconds(target['p50']), formatSeconds(target['p95']), formatSeconds(target['p99'])))
+    print('')
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Summarize ALB access logs per host, path prefix, target group and listener route.')
+  parser.add_argument('directory', help='Directory the access log files (.log or .log.gz) are in, searched recursively.')
+  parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of worker processes.')
+  parser.add_argument('--path-depth', type=int, default=1, help='Number of path segments the path prefixes are grouped by.')
+  parser.add_argument('--json', metavar='PATH', help='Write the summary and recommendations as JSON.')
+  parser.add_argument('--profile', default='default', help='Target group profile the target groups are deployed with.')
+  parser.add_argument('--hits', metavar='PATH', help='Write the requests per listener route, e.g. listener_hits.json for listeners.py.')
+  args = parser.parse_args(argv)
+  from listeners import ROUTES
+  summary = analyzeDirectory(args.directory, ROUTES, args.path_depth, args.jobs)
+  printSummary(summary)
+  recommendations = recommend(summary, args.profile)
+  for name, parameters in sorted(recommendations.items()):
+    print('{}: {}'.format('ALB' if name == '*' else name, ', '.join('{}={}'.format(key, value) for key, value in sorted(parameters.items()))))
+  if args.json:
+    report = {}
+    for (dimension, value), stats in summary.items():
+      report.setdefault(dimension, {})[value] = stats.report()
+    with open(args.json, 'w') as file:
+      json.dump({'groups': report, 'recommendations': recommendations}, file, indent=2, sort_keys=True)
+  if args.hits:
+    with open(args.hits, 'w') as file:
+      json.dump(hitCounts(summary), file, indent=2, sort_keys=True)
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,57 @@
+from troposphere import AWSObject, Join, Ref
+from troposphere.autoscaling import ScalingPolicy, TargetTrackingConfiguration, PredefinedMetricSpecification
+from troposphere.validators import integer
+
+try:
+  from troposphere.autoscaling import WarmPool
+except ImportError:
+  # troposphere releases before 2.7 do not know warm pools.
+  class WarmPool(AWSObject):
+    resource_type = "AWS::AutoScaling::WarmPool"
+
+    props = {
+      'AutoScalingGroupName': (str, True),
+      'MaxGroupPreparedCapacity': (integer, False),
+      'MinSize': (integer, False),
+      'PoolState': (str, False),
+    }
+
+# Target tracking keeps a metric of the group at a target value: the group scales out when any
+# policy is above its target and only scales in when all of them allow it.
+
+WARM_POOL_STATES = ('Stopped', 'Running', 'Hibernated')
+
+def albResourceLabel(load_balancer, target_group):
+  # ResourceLabel of ALBRequestCountPerTarget from the LoadBalancerFullName and TargetGroupFullName.
+  return Join("/", [load_balancer, target_group])
+
+def createTargetTrackingPolicy(template, title, auto_scaling_group, metric_type, target_value, resource_label=None, estimated_warmup=None):
+  metric = PredefinedMetricSpecification(PredefinedMetricType=metric_type)
+  if resource_label is not None:
+    metric.ResourceLabel = resource_label
+  policy = ScalingPolicy(
+    title,
+    AutoScalingGroupName=Ref(auto_scaling_group),
+    PolicyType="TargetTrackingScaling",
+    TargetTrackingConfiguration=TargetTrackingConfiguration(
+      PredefinedMetricSpecification=metric,
+      TargetValue=target_value
+    )
+  )
+  if estimated_warmup is not None:
+    policy.EstimatedInstanceWarmup = estimated_warmup
+  return template.add_resource(policy)
+
+def createWarmPool(template, title, auto_scaling_group, min_size, pool_state="Stopped"):
+  # Instances that were launched and initialized ahead of time, kept stopped or running outside the
+  # group so scaling out only has to start them.
+  if isinstance(pool_state, str) and pool_state not in WARM_POOL_STATES:
+    raise ValueError("Unknown warm pool state {}, expected one of {}".format(pool_state, ", ".join(WARM_POOL_STATES)))
+  return template.add_resource(
+    WarmPool(
+      title,
+      AutoScalingGroupName=Ref(auto_scaling_group),
+      MinSize=min_size,
+      PoolState=pool_state
+    )
+  )
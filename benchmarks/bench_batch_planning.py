@@ -0,0 +1,39 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vpc_functions import calculateSubnets, calculateSubnetsBatch
+
+# Plans public and private subnets for 10k VPCs with the scalar and the batch API and checks they agree.
+
+VPC_COUNT = 10000
+
+def randomVPCs(count, seed=0):
+  generator = random.Random(seed)
+  vpcs = []
+  for _ in range(count):
+    prefixlen = generator.randint(16, 22)
+    network = generator.randint(0, (1 << prefixlen) - 1) << (32 - prefixlen)
+    cidr = '{}.{}.{}.{}/{}'.format(network >> 24, (network >> 16) & 255, (network >> 8) & 255, network & 255, prefixlen)
+    vpcs.append((cidr, generator.randint(1, 6)))
+  return vpcs
+
+def main():
+  vpcs = randomVPCs(VPC_COUNT)
+  calculateSubnetsBatch(['10.0.0.0/16'], [3])
+  start = time.time()
+  scalar_private = [calculateSubnets(cidr, azs, 'private') for cidr, azs in vpcs]
+  scalar_public = [calculateSubnets(cidr, azs, 'public') for cidr, azs in vpcs]
+  scalar_time = time.time() - start
+  start = time.time()
+  batch_private, batch_public = calculateSubnetsBatch([cidr for cidr, _ in vpcs], [azs for _, azs in vpcs])
+  batch_time = time.time() - start
+  if scalar_private != batch_private or scalar_public != batch_public:
+    raise SystemExit('Batch planning disagrees with calculateSubnets')
+  print('{} VPCs: scalar {:.3f}s, batch {:.3f}s ({:.1f}x)'.format(VPC_COUNT, scalar_time, batch_time, scalar_time / batch_time))
+
+if __name__ == '__main__':
+  main()
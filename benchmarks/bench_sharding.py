@@ -0,0 +1,48 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stack_registry import registerStack, writeStack
+from template_graph import loadTemplateFile
+from template_sharding import limitViolations
+
+# Renders a registered stack that is over the CloudFormation resource limit through writeStack,
+# checks it is written as a parent plus nested stack templates that are all within the limits and
+# prints the timing. Every parameter stays on the parent, so the AZ count keeps it below 200.
+
+AZS = 90
+
+@registerStack("WideNetwork", "WideNetwork.yaml")
+def createWideNetworkTemplate(azs=AZS):
+  from troposphere import Template
+  from vpc_functions import createVPC, createPublicNetworks, createPrivateNetworks, planTiers
+  template = Template()
+  vpc_parameter, vpc_resource = createVPC(template, 'VPC', '10.0.0.0/16')
+  plan = planTiers('10.0.0.0/16', [{'name': 'PublicNet', 'hosts': 100, 'azs': azs}, {'name': 'PrivateNet', 'hosts': 100, 'azs': azs}])
+  createPublicNetworks(template, vpc_parameter, vpc_resource, azs, subnets=plan['PublicNet'])
+  createPrivateNetworks(template, vpc_parameter, vpc_resource, azs, subnets=plan['PrivateNet'])
+  return template
+
+def main():
+  output_dir = tempfile.mkdtemp()
+  try:
+    start = time.time()
+    paths = writeStack("WideNetwork", output_dir)
+    seconds = time.time() - start
+    if len(paths) < 2:
+      raise SystemExit('WideNetwork was not sharded')
+    for path in paths:
+      violations = limitViolations(loadTemplateFile(path))
+      if violations:
+        raise SystemExit('{} exceeds the template limits: {}'.format(os.path.basename(path), ', '.join(violations)))
+    parent = loadTemplateFile(paths[0])
+    print('{} AZs: parent with {} resources and {} parameters, {} nested stacks in {:.3f}s'.format(AZS, len(parent['Resources']), len(parent['Parameters']), len(paths) - 1, seconds))
+  finally:
+    shutil.rmtree(output_dir)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,50 @@
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cfn_flip
+from troposphere import Template
+from template_writer import writeTemplate
+from vpc_functions import createVPC, createPublicNetworks, createPrivateNetworks, planTiers
+
+# Serializes a wide multi-tier network template with Template.to_yaml() and with writeTemplate,
+# checks both load to the same template and prints the timings.
+
+REPEAT = 5
+
+# Template.add_resource of the pinned troposphere raises above 200 resources and 60 parameters, so
+# the template stays below that: 173 resources and 31 parameters.
+def wideNetworkTemplate(tier_count=9, azs=3):
+  template = Template()
+  vpc_parameter, vpc_resource = createVPC(template, 'VPC', '10.0.0.0/16')
+  tiers = [{'name': 'PublicNet', 'hosts': 250, 'azs': azs}] + [{'name': 'Tier{:02d}Net'.format(index), 'hosts': 250, 'azs': azs} for index in range(tier_count)]
+  plan = planTiers('10.0.0.0/16', tiers)
+  createPublicNetworks(template, vpc_parameter, vpc_resource, azs, subnets=plan['PublicNet'])
+  for index in range(tier_count):
+    name = 'Tier{:02d}Net'.format(index)
+    createPrivateNetworks(template, vpc_parameter, vpc_resource, azs, subnets=plan[name], tier_name=name)
+  return template
+
+def timed(function):
+  start = time.time()
+  for _ in range(REPEAT):
+    result = function()
+  return result, (time.time() - start) / REPEAT
+
+def main():
+  template = wideNetworkTemplate()
+  def direct():
+    output = io.StringIO()
+    writeTemplate(template, output)
+    return output.getvalue()
+  round_trip, round_trip_time = timed(template.to_yaml)
+  streamed, streamed_time = timed(direct)
+  if cfn_flip.load_yaml(round_trip) != cfn_flip.load_yaml(streamed):
+    raise SystemExit('writeTemplate output differs from Template.to_yaml()')
+  print('{} resources: to_yaml {:.3f}s, writeTemplate {:.3f}s ({:.1f}x)'.format(len(template.resources), round_trip_time, streamed_time, round_trip_time / streamed_time))
+
+if __name__ == '__main__':
+  main()
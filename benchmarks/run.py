@@ -0,0 +1,102 @@
+import argparse
+import inspect
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import suite
+
+# Runs the asv style benchmarks in suite.py, appends the results to a local history file and
+# flags every benchmark that got slower than the previous run by more than the threshold.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_FILE = os.path.join(ROOT, '.benchmarks', 'history.json')
+MIN_RUN_TIME = 0.02
+REPEAT = 3
+
+def benchmarkClasses():
+  return [cls for _, cls in inspect.getmembers(suite, inspect.isclass) if cls.__module__ == suite.__name__ and hasattr(cls, 'params')]
+
+def benchmarkKey(cls, method, params):
+  return '{}.{}({})'.format(cls.__name__, method, ', '.join('{}={}'.format(name, value) for name, value in zip(cls.param_names, params)))
+
+def timeBenchmark(function):
+  timer = timeit.Timer(function)
+  number = 1
+  while timer.timeit(number) < MIN_RUN_TIME:
+    number *= 2
+  return min(timer.repeat(REPEAT, number)) / number
+
+def runBenchmarks(pattern=None):
+  results = {}
+  for cls in benchmarkClasses():
+    methods = sorted(name for name in dir(cls) if name.startswith('time_'))
+    for params in itertools.product(*cls.params):
+      keys = [(method, benchmarkKey(cls, method, params)) for method in methods]
+      keys = [(method, key) for method, key in keys if not pattern or pattern in key]
+      if not keys:
+        continue
+      instance = cls()
+      try:
+        instance.setup(*params)
+      except NotImplementedError:
+        continue
+      for method, key in keys:
+        function = getattr(instance, method)
+        results[key] = timeBenchmark(lambda: function(*params))
+  return results
+
+def loadHistory(path):
+  if not os.path.exists(path):
+    return []
+  with open(path) as file:
+    return json.load(file)
+
+def saveHistory(path, history):
+  if not os.path.isdir(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path))
+  with open(path, 'w') as file:
+    json.dump(history, file, indent=1, sort_keys=True)
+
+def currentCommit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def findRegressions(previous, current, threshold):
+  regressions = []
+  for key, seconds in sorted(current.items()):
+    if key in previous and seconds > previous[key] * (1 + threshold):
+      regressions.append((key, previous[key], seconds))
+  return regressions
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Run the template generation benchmarks and compare with the previous run.')
+  parser.add_argument('-k', '--filter', help='Only run benchmarks whose name contains this string.')
+  parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown reported as a regression (default 0.2 = 20%%).')
+  parser.add_argument('--history', default=HISTORY_FILE, help='JSON file the results are appended to.')
+  parser.add_argument('--no-save', action='store_true', help='Do not append this run to the history.')
+  args = parser.parse_args(argv)
+  results = runBenchmarks(args.filter)
+  history = loadHistory(args.history)
+  previous = history[-1]['results'] if history else {}
+  for key, seconds in sorted(results.items()):
+    change = ' {:+.1%}'.format(seconds / previous[key] - 1) if key in previous else ''
+    print('{:<70} {:>10.1f}us{}'.format(key, seconds * 1e6, change))
+  regressions = findRegressions(previous, results, args.threshold)
+  for key, before, after in regressions:
+    print('REGRESSION {}: {:.1f}us -> {:.1f}us'.format(key, before * 1e6, after * 1e6))
+  if not args.no_save:
+    history.append({'commit': currentCommit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results})
+    saveHistory(args.history, history)
+  return 1 if regressions else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,90 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# asv style benchmarks: classes with params/param_names, setup() and time_* methods. setup() raises
+# NotImplementedError for parameter combinations that cannot be planned. Run with benchmarks/run.py.
+
+AZ_COUNTS = [1, 2, 3, 4, 5, 6]
+TIER_COUNTS = [1, 2, 4, 8]
+VPC_PREFIX_LENGTHS = [16, 18, 20, 22, 24]
+
+def vpcCidr(prefixlen):
+  return '10.0.0.0/{}'.format(prefixlen)
+
+class CalculateSubnets(object):
+  params = [AZ_COUNTS, VPC_PREFIX_LENGTHS]
+  param_names = ['azs', 'prefixlen']
+
+  def setup(self, azs, prefixlen):
+    from vpc_functions import calculateSubnets, clearSubnetPlanCache
+    try:
+      calculateSubnets(vpcCidr(prefixlen), azs, 'public')
+    except ValueError:
+      raise NotImplementedError()
+    self.calculateSubnets = calculateSubnets
+    self.clearSubnetPlanCache = clearSubnetPlanCache
+
+  def time_calculateSubnets(self, azs, prefixlen):
+    self.clearSubnetPlanCache()
+    self.calculateSubnets(vpcCidr(prefixlen), azs, 'private')
+    self.calculateSubnets(vpcCidr(prefixlen), azs, 'public')
+
+class NetworkTemplates(object):
+  params = [AZ_COUNTS, TIER_COUNTS, VPC_PREFIX_LENGTHS]
+  param_names = ['azs', 'tiers', 'prefixlen']
+
+  def setup(self, azs, tiers, prefixlen):
+    from vpc_functions import planTiers
+    tier_names = ['PublicNet'] + ['Tier{:02d}Net'.format(index) for index in range(tiers)]
+    try:
+      self.plan = planTiers(vpcCidr(prefixlen), [{'name': name, 'hosts': 11, 'azs': azs} for name in tier_names])
+    except ValueError:
+      raise NotImplementedError()
+
+  def newTemplate(self):
+    from troposphere import Template
+    from vpc_functions import createVPC
+    template = Template()
+    vpc_parameter, vpc_resource = createVPC(template, 'VPC', vpcCidr(self.prefixlen))
+    return template, vpc_parameter, vpc_resource
+
+  def time_createPublicNetworks(self, azs, tiers, prefixlen):
+    from vpc_functions import createPublicNetworks
+    self.prefixlen = prefixlen
+    template, vpc_parameter, vpc_resource = self.newTemplate()
+    createPublicNetworks(template, vpc_parameter, vpc_resource, azs, subnets=self.plan['PublicNet'])
+
+  def time_createPrivateNetworks(self, azs, tiers, prefixlen):
+    from vpc_functions import createPrivateNetworks
+    self.prefixlen = prefixlen
+    template, vpc_parameter, vpc_resource = self.newTemplate()
+    for name, subnets in self.plan.items():
+      if name != 'PublicNet':
+        createPrivateNetworks(template, vpc_parameter, vpc_resource, azs, subnets=subnets, tier_name=name)
+
+def stackNames():
+  from stack_registry import loadStacks
+  return sorted(loadStacks())
+
+class Stacks(object):
+  params = [stackNames()]
+  param_names = ['stack']
+
+  def setup(self, stack):
+    from stack_registry import STACKS
+    self.factory = STACKS[stack].factory
+    self.template = self.factory()
+
+  def time_render(self, stack):
+    self.factory()
+
+  def time_serialize(self, stack):
+    from template_writer import writeTemplate
+    writeTemplate(self.template, io.StringIO())
+
+  def time_render_and_serialize(self, stack):
+    from template_writer import writeTemplate
+    writeTemplate(self.factory(), io.StringIO())
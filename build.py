@@ -0,0 +1,226 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from stack_registry import loadStacks, writeStack
+
+# Renders every registered stack concurrently and reports how long each one took. Outputs are cached
+# by a hash of the stack source, the local modules it imports, its input files and the troposphere
+# version.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ROOT, '.build_cache')
+
+def renderStack(name, module, output_dir, profile=False):
+  # Builds one registered stack into output_dir in a worker process. The working directory stays
+  # as it is, since the stack modules import their helpers lazily and may be found through it.
+  # With profile set, the profiling report of the render is returned as well.
+  loadStacks([module])
+  if profile:
+    import profiling
+    profiling.resetProfiling()
+    profiling.enableProfiling(allocations=True)
+  start = time.time()
+  try:
+    paths = writeStack(name, output_dir)
+  finally:
+    if profile:
+      profiling.disableProfiling()
+  return name, time.time() - start, paths, profiling.profilingReport() if profile else None
+
+def localImports(name, root=ROOT):
+  with open(os.path.join(root, name + '.py')) as file:
+    tree = ast.parse(file.read())
+  modules = set()
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Import):
+      modules.update(alias.name for alias in node.names)
+    elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+      modules.add(node.module)
+  return sorted(module for module in modules if os.path.exists(os.path.join(root, module + '.py')))
+
+def stackHash(name, root=ROOT, inputs=()):
+  import troposphere
+  digest = hashlib.sha256(('troposphere ' + troposphere.__version__).encode())
+  seen = set()
+  pending = [name]
+  while pending:
+    module = pending.pop()
+    if module in seen:
+      continue
+    seen.add(module)
+    with open(os.path.join(root, module + '.py'), 'rb') as file:
+      digest.update(module.encode() + b'\0' + file.read() + b'\0')
+    pending.extend(localImports(module, root))
+  for path in sorted(inputs):
+    digest.update(path.encode() + b'\0')
+    if os.path.exists(os.path.join(root, path)):
+      with open(os.path.join(root, path), 'rb') as file:
+        digest.update(file.read() + b'\0')
+  return digest.hexdigest()
+
+def restoreFromCache(cache_dir, name, key, output_dir):
+  entry = os.path.join(cache_dir, name, key)
+  manifest = os.path.join(entry, 'manifest.json')
+  if not os.path.exists(manifest):
+    return None
+  with open(manifest) as file:
+    outputs = json.load(file)
+  paths = []
+  for output in outputs:
+    path = os.path.join(output_dir, output)
+    shutil.copyfile(os.path.join(entry, output), path)
+    paths.append(path)
+  return paths
+
+def storeInCache(cache_dir, name, key, outputs):
+  entry = os.path.join(cache_dir, name, key)
+  if os.path.isdir(os.path.join(cache_dir, name)):
+    shutil.rmtree(os.path.join(cache_dir, name))
+  os.makedirs(entry)
+  for path in outputs:
+    shutil.copyfile(path, os.path.join(entry, os.path.basename(path)))
+  with open(os.path.join(entry, 'manifest.json'), 'w') as file:
+    json.dump([os.path.basename(path) for path in outputs], file)
+
+def build(stacks, output_dir, jobs=None, cache_dir=CACHE_DIR, profile_reports=None):
+  # Returns {stack: (seconds, outputs, cached)} for rendered or restored stacks and
+  # {stack: exception} for the ones that failed. cache_dir=None disables the cache.
+  # Passing a list as profile_reports profiles every rendered stack and collects the reports.
+  output_dir = os.path.abspath(output_dir)
+  if not os.path.isdir(output_dir):
+    os.makedirs(output_dir)
+  definitions = loadStacks()
+  results = {}
+  failures = {}
+  keys = {}
+  pending = []
+  for name in stacks:
+    if cache_dir:
+      start = time.time()
+      keys[name] = stackHash(definitions[name].module, inputs=definitions[name].inputs)
+      outputs = restoreFromCache(cache_dir, name, keys[name], output_dir)
+      if outputs is not None:
+        results[name] = (time.time() - start, outputs, True)
+        continue
+    pending.append(name)
+  if not pending:
+    return results, failures
+  with ProcessPoolExecutor(max_workers=jobs) as executor:
+    futures = dict((executor.submit(renderStack, name, definitions[name].module, output_dir, profile_reports is not None), name) for name in pending)
+    for future in as_completed(futures):
+      try:
+        name, seconds, outputs, report = future.result()
+      except Exception as error:
+        failures[futures[future]] = error
+        continue
+      results[name] = (seconds, outputs, False)
+      if report is not None:
+        profile_reports.append(report)
+      if cache_dir:
+        storeInCache(cache_dir, name, keys[name], outputs)
+  return results, failures
+
+def stackDependencies(results, output_dir):
+  # Indexes the exports and imports of the rendered templates, plus the templates of stacks that
+  # were not rebuilt and are already in output_dir. Returns (index, {stack: stacks it imports from}).
+  from export_registry import ExportIndex
+  from template_graph import loadTemplateFile
+  index = ExportIndex()
+  for name, definition in sorted(loadStacks().items()):
+    if name in results:
+      paths = results[name][1]
+    else:
+      paths = [path for path in [os.path.join(output_dir, definition.output)] if os.path.exists(path)]
+    for path in paths:
+      index.addTemplate(name, loadTemplateFile(path))
+  return index, index.resolve()
+
+def cidrConflicts(results, output_dir):
+  # Overlapping VPC and subnet CIDR blocks across the rendered templates and the templates of
+  # stacks that were not rebuilt and are already in output_dir, as messages.
+  from cidr_index import CidrIndex, describeConflict, indexTemplate
+  from template_graph import loadTemplateFile
+  index = CidrIndex()
+  for name, definition in sorted(loadStacks().items()):
+    if name in results:
+      paths = results[name][1]
+    else:
+      paths = [path for path in [os.path.join(output_dir, definition.output)] if os.path.exists(path)]
+    for path in paths:
+      indexTemplate(index, loadTemplateFile(path), name)
+  return [describeConflict(*conflict) for conflict in index.findConflicts()]
+
+def validateOutputs(results, cache_dir):
+  # Returns [(path, location, message)] for the rendered templates, with findings cached in cache_dir.
+  from template_graph import loadTemplateFile
+  from template_validator import TemplateValidator
+  validator = TemplateValidator(os.path.join(cache_dir, 'validation.json') if cache_dir else None)
+  findings = []
+  for name in sorted(results):
+    for path in results[name][1]:
+      findings.extend((path, location, message) for location, message in validator.validate(loadTemplateFile(path)))
+  validator.save()
+  return findings
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Render CloudFormation templates for all stacks in parallel.')
+  parser.add_argument('stacks', nargs='*', help='Stacks to render. Defaults to every stack module.')
+  parser.add_argument('-o', '--output-dir', default='.', help='Directory the templates are written to.')
+  parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of worker processes.')
+  parser.add_argument('--cache-dir', default=CACHE_DIR, help='Directory rendered templates are cached in.')
+  parser.add_argument('--no-cache', action='store_true', help='Render every stack even if its inputs did not change.')
+  parser.add_argument('--no-validate', action='store_true', help='Skip validating the rendered templates.')
+  parser.add_argument('--strict', action='store_true', help='Fail when an ImportValue does not resolve to an export of a stack or CIDR blocks of the stacks overlap.')
+  parser.add_argument('--graph', metavar='PATH', help='Write the dependencies between stacks and their deploy order as JSON.')
+  parser.add_argument('--profile', metavar='REPORT', help='Profile every stack and write a JSON report here and folded stacks to REPORT.folded. Implies --no-cache.')
+  args = parser.parse_args(argv)
+  if args.profile:
+    args.no_cache = True
+  definitions = loadStacks()
+  unknown = [name for name in args.stacks if name not in definitions]
+  if unknown:
+    parser.error('unknown stack(s) {}; known stacks: {}'.format(', '.join(unknown), ', '.join(sorted(definitions))))
+  stacks = args.stacks or sorted(definitions)
+  profile_reports = [] if args.profile else None
+  start = time.time()
+  results, failures = build(stacks, args.output_dir, args.jobs, None if args.no_cache else args.cache_dir, profile_reports)
+  wall_time = time.time() - start
+  if args.profile:
+    import profiling
+    report = profiling.mergeReports(profile_reports)
+    profiling.writeReport(args.profile, report)
+    profiling.writeFoldedStacks(args.profile + '.folded', report)
+  for name in sorted(results, key=lambda name: -results[name][0]):
+    seconds, outputs, cached = results[name]
+    print('{:<16} {:>7.3f}s {:<6} {}'.format(name, seconds, 'cached' if cached else '', ', '.join(os.path.relpath(path) for path in outputs)))
+  for name, error in sorted(failures.items()):
+    print('{:<16} FAILED   {}: {}'.format(name, type(error).__name__, error))
+  print('{} stacks in {:.3f}s wall time ({:.3f}s of stack time)'.format(len(stacks), wall_time, sum(result[0] for result in results.values())))
+  if not args.no_cache:
+    hits = sum(1 for result in results.values() if result[2])
+    print('Build cache: {} hits, {} misses'.format(hits, len(stacks) - hits))
+  findings = [] if args.no_validate else validateOutputs(results, None if args.no_cache else args.cache_dir)
+  for path, location, message in findings:
+    print('error: {}: {}: {}'.format(os.path.relpath(path), location, message))
+  conflicts = [] if args.no_validate else cidrConflicts(results, args.output_dir)
+  for conflict in conflicts:
+    print('{}: {}'.format('error' if args.strict else 'warning', conflict))
+  from export_registry import deployOrder
+  index, dependencies = stackDependencies(results, args.output_dir)
+  for problem in index.problems:
+    print('{}: {}'.format('error' if args.strict else 'warning', problem))
+  order = deployOrder(dependencies)
+  print('Deploy order: ' + ' -> '.join(', '.join(wave) for wave in order))
+  if args.graph:
+    with open(args.graph, 'w') as file:
+      json.dump({'dependencies': dict((stack, sorted(imported)) for stack, imported in dependencies.items()), 'order': order}, file, indent=2, sort_keys=True)
+  return 1 if failures or findings or (args.strict and (index.problems or conflicts)) else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,134 @@
+import bisect
+
+# IPv4 CIDR arithmetic on plain integers plus a buddy allocator for free address space.
+
+ADDRESS_BITS = 32
+
+def ipToInt(address):
+  octets = address.split('.')
+  if len(octets) != 4:
+    raise ValueError('Invalid IPv4 address: {}'.format(address))
+  value = 0
+  for octet in octets:
+    octet = int(octet)
+    if octet < 0 or octet > 255:
+      raise ValueError('Invalid IPv4 address: {}'.format(address))
+    value = (value << 8) | octet
+  return value
+
+def intToIp(value):
+  return '{}.{}.{}.{}'.format((value >> 24) & 255, (value >> 16) & 255, (value >> 8) & 255, value & 255)
+
+def prefixMask(prefixlen):
+  return ((1 << ADDRESS_BITS) - 1) ^ ((1 << (ADDRESS_BITS - prefixlen)) - 1)
+
+def blockSize(prefixlen):
+  return 1 << (ADDRESS_BITS - prefixlen)
+
+def parseCidr(cidr):
+  address, _, prefixlen = str(cidr).partition('/')
+  prefixlen = int(prefixlen) if prefixlen else ADDRESS_BITS
+  if prefixlen < 0 or prefixlen > ADDRESS_BITS:
+    raise ValueError('Invalid prefix length: {}'.format(cidr))
+  return ipToInt(address) & prefixMask(prefixlen), prefixlen
+
+def formatCidr(network, prefixlen):
+  return intToIp(network) + '/' + str(prefixlen)
+
+def nextPowerOfTwo(integer):
+  if integer < 1:
+    raise ValueError('Expected a positive integer, got {}'.format(integer))
+  return 1 << (integer - 1).bit_length()
+
+def log2(power_of_two):
+  return power_of_two.bit_length() - 1
+
+class BuddyAllocator(object):
+  # Free space is kept as maximal aligned blocks, one sorted list of network addresses per prefix
+  # length. Reserving or allocating splits a block down to the requested size; releasing merges
+  # buddies back up. The free blocks are therefore always the minimal CIDR cover of the free space.
+
+  def __init__(self, cidr_range):
+    self.network, self.prefixlen = parseCidr(cidr_range)
+    self.free = dict((prefixlen, []) for prefixlen in range(self.prefixlen, ADDRESS_BITS + 1))
+    self.free[self.prefixlen].append(self.network)
+
+  def _take(self, network, prefixlen):
+    blocks = self.free[prefixlen]
+    del blocks[bisect.bisect_left(blocks, network)]
+
+  def _isFree(self, network, prefixlen):
+    blocks = self.free[prefixlen]
+    index = bisect.bisect_left(blocks, network)
+    return index < len(blocks) and blocks[index] == network
+
+  def _split(self, network, from_prefixlen, to_prefixlen, target):
+    # Split the free block (network, from_prefixlen) down to the block of to_prefixlen holding target.
+    self._take(network, from_prefixlen)
+    for prefixlen in range(from_prefixlen + 1, to_prefixlen + 1):
+      size = blockSize(prefixlen)
+      if target & size:
+        bisect.insort(self.free[prefixlen], network)
+        network += size
+      else:
+        bisect.insort(self.free[prefixlen], network + size)
+    return network
+
+  def contains(self, network, prefixlen):
+    return prefixlen >= self.prefixlen and (network & prefixMask(self.prefixlen)) == self.network
+
+  def reserveNetwork(self, network, prefixlen):
+    if not self.contains(network, prefixlen):
+      raise ValueError('{} is outside of {}'.format(formatCidr(network, prefixlen), formatCidr(self.network, self.prefixlen)))
+    for parent_prefixlen in range(prefixlen, self.prefixlen - 1, -1):
+      parent = network & prefixMask(parent_prefixlen)
+      if self._isFree(parent, parent_prefixlen):
+        self._split(parent, parent_prefixlen, prefixlen, network)
+        return network
+    raise ValueError('{} overlaps an allocated range'.format(formatCidr(network, prefixlen)))
+
+  def reserve(self, cidr):
+    network, prefixlen = parseCidr(cidr)
+    return formatCidr(self.reserveNetwork(network, prefixlen), prefixlen)
+
+  def reserveBlocks(self, network, prefixlen, count):
+    # Reserve a contiguous run of count /prefixlen blocks as the few aligned blocks that cover it.
+    end = network + count * blockSize(prefixlen)
+    while network < end:
+      run_prefixlen = prefixlen
+      while run_prefixlen > self.prefixlen and not network & (blockSize(run_prefixlen - 1) - 1) and network + blockSize(run_prefixlen - 1) <= end:
+        run_prefixlen -= 1
+      self.reserveNetwork(network, run_prefixlen)
+      network += blockSize(run_prefixlen)
+
+  def allocate(self, prefixlen):
+    # Best fit: carve from the smallest free block that can hold the request, lowest address first.
+    if prefixlen < self.prefixlen or prefixlen > ADDRESS_BITS:
+      raise ValueError('Cannot allocate a /{} from {}'.format(prefixlen, formatCidr(self.network, self.prefixlen)))
+    for free_prefixlen in range(prefixlen, self.prefixlen - 1, -1):
+      if self.free[free_prefixlen]:
+        parent = self.free[free_prefixlen][0]
+        network = self._split(parent, free_prefixlen, prefixlen, parent)
+        return formatCidr(network, prefixlen)
+    raise ValueError('No free /{} left in {}'.format(prefixlen, formatCidr(self.network, self.prefixlen)))
+
+  def release(self, cidr):
+    network, prefixlen = parseCidr(cidr)
+    while prefixlen > self.prefixlen:
+      buddy = network ^ blockSize(prefixlen)
+      if not self._isFree(buddy, prefixlen):
+        break
+      self._take(buddy, prefixlen)
+      network &= buddy
+      prefixlen -= 1
+    bisect.insort(self.free[prefixlen], network)
+
+  def freeBlocks(self):
+    blocks = [(network, prefixlen) for prefixlen, networks in self.free.items() for network in networks]
+    return [formatCidr(network, prefixlen) for network, prefixlen in sorted(blocks)]
+
+  def firstFreeBlock(self):
+    blocks = [(networks[0], prefixlen) for prefixlen, networks in self.free.items() if networks]
+    if not blocks:
+      raise ValueError('No free space left in {}'.format(formatCidr(self.network, self.prefixlen)))
+    return formatCidr(*min(blocks))
@@ -0,0 +1,143 @@
+import bisect
+import sys
+from cidr_allocator import parseCidr, formatCidr, blockSize
+from template_graph import templateData, loadTemplateFile
+
+# Index of every VPC and subnet CIDR a set of templates declares, for overlap checks before
+# peering or Transit Gateway attachments fail at deploy time.
+# CIDR blocks either nest or are disjoint, so entries sorted by (network, prefix length) form a
+# forest: the blocks containing an address are the chain of parents above the last entry starting
+# at or before it. Queries are a bisect plus a walk up that chain.
+
+VPC = 'vpc'
+SUBNET = 'subnet'
+
+class CidrEntry(object):
+
+  def __init__(self, cidr, name, kind, group):
+    self.network, self.prefixlen = parseCidr(cidr)
+    self.end = self.network + blockSize(self.prefixlen)
+    self.cidr = formatCidr(self.network, self.prefixlen)
+    self.name = name
+    self.kind = kind
+    self.group = group
+    self.parent = None
+
+  def contains(self, other):
+    return self.network <= other.network and other.end <= self.end
+
+  def __repr__(self):
+    return 'CidrEntry({!r}, {!r}, {!r}, {!r})'.format(self.cidr, self.name, self.kind, self.group)
+
+class CidrIndex(object):
+
+  def __init__(self):
+    self.entries = []
+    self.starts = []
+    self.dirty = False
+
+  def add(self, cidr, name, kind=SUBNET, group=None):
+    entry = CidrEntry(cidr, name, kind, group)
+    self.entries.append(entry)
+    self.dirty = True
+    return entry
+
+  def _build(self):
+    if not self.dirty:
+      return
+    self.entries.sort(key=lambda entry: (entry.network, entry.prefixlen))
+    self.starts = [entry.network for entry in self.entries]
+    stack = []
+    for entry in self.entries:
+      while stack and not stack[-1].contains(entry):
+        stack.pop()
+      entry.parent = stack[-1] if stack else None
+      stack.append(entry)
+    self.dirty = False
+
+  def containing(self, cidr):
+    # Entries that contain cidr (including equal ones), innermost first.
+    self._build()
+    query = CidrEntry(cidr, None, None, None)
+    index = bisect.bisect_right(self.starts, query.network) - 1
+    entry = self.entries[index] if index >= 0 else None
+    while entry is not None and not entry.contains(query):
+      entry = entry.parent
+    result = []
+    while entry is not None:
+      result.append(entry)
+      entry = entry.parent
+    return result
+
+  def contained(self, cidr):
+    # Entries strictly inside cidr.
+    self._build()
+    query = CidrEntry(cidr, None, None, None)
+    low = bisect.bisect_left(self.starts, query.network)
+    high = bisect.bisect_left(self.starts, query.end)
+    return [entry for entry in self.entries[low:high] if entry.prefixlen > query.prefixlen]
+
+  def overlaps(self, cidr):
+    return self.containing(cidr) + self.contained(cidr)
+
+  def contains(self, cidr, kind=None):
+    return any(kind is None or entry.kind == kind for entry in self.containing(cidr))
+
+  def findConflicts(self):
+    # Overlapping VPCs, overlapping subnets and subnets outside the VPC they belong to.
+    self._build()
+    conflicts = []
+    for entry in self.entries:
+      parent = entry.parent
+      while parent is not None:
+        if parent.kind == entry.kind:
+          conflicts.append(('overlap', parent, entry))
+        parent = parent.parent
+      if entry.kind == SUBNET and entry.group is not None:
+        parent = entry.parent
+        while parent is not None and not (parent.kind == VPC and parent.name == entry.group):
+          parent = parent.parent
+        if parent is None:
+          conflicts.append(('outside-vpc', None, entry))
+    return conflicts
+
+def _cidrValue(value, parameters):
+  if isinstance(value, dict) and 'Ref' in value:
+    return parameters.get(value['Ref'], {}).get('Default')
+  return value
+
+def indexTemplate(index, template, stack_name):
+  # Adds the VPCs and subnets of a troposphere Template or a loaded template dict. Names are
+  # stack_name:LogicalId; subnets are grouped under the VPC their VpcId refers to.
+  template_data = templateData(template)
+  parameters = template_data.get('Parameters', {})
+  for name, resource in template_data.get('Resources', {}).items():
+    properties = resource.get('Properties', {})
+    cidr = _cidrValue(properties.get('CidrBlock'), parameters)
+    if not isinstance(cidr, str):
+      continue
+    if resource.get('Type') == 'AWS::EC2::VPC':
+      index.add(cidr, stack_name + ':' + name, VPC)
+    elif resource.get('Type') == 'AWS::EC2::Subnet':
+      vpc_id = properties.get('VpcId')
+      group = stack_name + ':' + vpc_id['Ref'] if isinstance(vpc_id, dict) and 'Ref' in vpc_id else None
+      index.add(cidr, stack_name + ':' + name, SUBNET, group)
+  return index
+
+def describeConflict(kind, outer, inner):
+  if outer is None:
+    return '{}: {} {} is outside its VPC'.format(kind, inner.name, inner.cidr)
+  return '{}: {} {} overlaps {} {}'.format(kind, inner.name, inner.cidr, outer.name, outer.cidr)
+
+def main(paths):
+  index = CidrIndex()
+  for path in paths:
+    indexTemplate(index, loadTemplateFile(path), path)
+  conflicts = index.findConflicts()
+  for conflict in conflicts:
+    print(describeConflict(*conflict))
+  print('{} networks indexed, {} conflicts'.format(len(index.entries), len(conflicts)))
+  return 1 if conflicts else 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,170 @@
+import argparse
+import json
+import sys
+from template_graph import templateData, loadTemplateFile, resourceReferences, dependsOn
+
+# Builds the resource dependency graph of a template and simulates stack creation with every
+# resource starting as soon as the resources it waits for are complete, which is how CloudFormation
+# schedules them. Resources are weighted with typical create times, so the critical path shows
+# where creation time goes. DependsOn edges are checked against the reference edges: an edge whose
+# target is already waited for through another path is redundant, and an edge on the critical path
+# is reported with the time removing it would save.
+
+DEFAULT_CREATE_SECONDS = 5
+RESOURCE_CREATE_SECONDS = {
+  'AWS::CloudFormation::Stack': 30,
+  'AWS::EC2::EIP': 5,
+  'AWS::EC2::InternetGateway': 15,
+  'AWS::EC2::NatGateway': 120,
+  'AWS::EC2::Route': 5,
+  'AWS::EC2::RouteTable': 5,
+  'AWS::EC2::Subnet': 5,
+  'AWS::EC2::SubnetRouteTableAssociation': 5,
+  'AWS::EC2::VPC': 15,
+  'AWS::EC2::VPCGatewayAttachment': 15,
+  'AWS::ElastiCache::CacheCluster': 420,
+  'AWS::ElastiCache::ReplicationGroup': 600,
+  'AWS::ElastiCache::SubnetGroup': 5,
+  'AWS::ElasticLoadBalancingV2::Listener': 5,
+  'AWS::ElasticLoadBalancingV2::LoadBalancer': 180,
+  'AWS::ElasticLoadBalancingV2::TargetGroup': 5,
+  'AWS::RDS::DBCluster': 600,
+  'AWS::RDS::DBInstance': 480,
+  'AWS::RDS::DBSubnetGroup': 5,
+}
+
+# DependsOn edges that order resources which do not refer to each other for a reason the template
+# cannot show. They are reported as required instead of as candidates for removal.
+REQUIRED_ORDERINGS = {
+  ('AWS::EC2::Route', 'AWS::EC2::VPCGatewayAttachment'): 'a route to an internet gateway fails until the gateway is attached to the VPC',
+  ('AWS::RDS::DBInstance', 'AWS::RDS::DBCluster'): 'the instance joins the cluster by DBClusterIdentifier, which is a parameter rather than a reference to the cluster',
+}
+
+REDUNDANT = 'redundant'
+REQUIRED = 'required'
+CRITICAL = 'critical'
+NEEDED = 'ok'
+
+class DependencyGraph(object):
+
+  def __init__(self, template, create_seconds=None):
+    template_data = templateData(template)
+    weights = dict(RESOURCE_CREATE_SECONDS, **(create_seconds or {}))
+    resources = template_data.get('Resources', {})
+    self.names = list(resources)
+    self.types = dict((name, resource.get('Type')) for name, resource in resources.items())
+    self.seconds = dict((name, weights.get(self.types[name], DEFAULT_CREATE_SECONDS)) for name in self.names)
+    self.references = resourceReferences(template_data)
+    self.depends_on = dict((name, [target for target in dependsOn(resource) if target in resources and target != name]) for name, resource in resources.items())
+
+  def waitsFor(self, name, skip=None):
+    targets = self.references[name] | set(self.depends_on[name])
+    if skip is not None and skip[0] == name and skip[1] not in self.references[name]:
+      targets.discard(skip[1])
+    return targets
+
+  def schedule(self, skip=None):
+    # {resource: (start, finish)} in seconds; skip=(resource, target) drops that DependsOn edge.
+    times = {}
+    def visit(name, path):
+      if name in times:
+        return times[name][1]
+      if name in path:
+        raise ValueError('Circular dependency: ' + ' -> '.join(path + [name]))
+      path.append(name)
+      start = max([visit(target, path) for target in self.waitsFor(name, skip)] or [0])
+      path.pop()
+      times[name] = (start, start + self.seconds[name])
+      return times[name][1]
+    for name in self.names:
+      visit(name, [])
+    return times
+
+  def totalSeconds(self, skip=None):
+    return max([finish for _, finish in self.schedule(skip).values()] or [0])
+
+  def criticalPath(self):
+    # The chain of resources that determines the create time, first resource first.
+    times = self.schedule()
+    if not times:
+      return []
+    name = max(self.names, key=lambda name: times[name][1])
+    path = [name]
+    while True:
+      start = times[name][0]
+      previous = [target for target in self.waitsFor(name) if times[target][1] == start]
+      if not previous or start == 0:
+        break
+      name = sorted(previous)[0]
+      path.append(name)
+    return path[::-1]
+
+  def reachable(self, source, target, skip):
+    pending = list(self.waitsFor(source, skip))
+    seen = set()
+    while pending:
+      name = pending.pop()
+      if name == target:
+        return True
+      if name not in seen:
+        seen.add(name)
+        pending.extend(self.waitsFor(name))
+    return False
+
+  def dependsOnFindings(self):
+    # [(resource, target, verdict, seconds saved by removing the edge, note)] for every DependsOn.
+    total = self.totalSeconds()
+    findings = []
+    for name in self.names:
+      for target in self.depends_on[name]:
+        edge = (name, target)
+        if target in self.references[name] or self.reachable(name, target, edge):
+          findings.append((name, target, REDUNDANT, 0, 'already waits for it through another dependency'))
+          continue
+        note = REQUIRED_ORDERINGS.get((self.types[name], self.types[target]))
+        saved = total - self.totalSeconds(edge)
+        if note:
+          findings.append((name, target, REQUIRED, saved, note))
+        elif saved > 0:
+          findings.append((name, target, CRITICAL, saved, 'on the critical path'))
+        else:
+          findings.append((name, target, NEEDED, 0, 'not on the critical path'))
+    return findings
+
+def analyzeTemplate(template, create_seconds=None):
+  graph = DependencyGraph(template, create_seconds)
+  times = graph.schedule()
+  return {
+    'seconds': graph.totalSeconds(),
+    'serial_seconds': sum(graph.seconds.values()),
+    'critical_path': [(name, graph.types[name], times[name][0], times[name][1]) for name in graph.criticalPath()],
+    'depends_on': graph.dependsOnFindings(),
+  }
+
+def printAnalysis(path, analysis):
+  print('{}: {}s to create, {}s if created one at a time'.format(path, analysis['seconds'], analysis['serial_seconds']))
+  print('  critical path:')
+  for name, resource_type, start, finish in analysis['critical_path']:
+    print('    {:>6}s {:>6}s  {} ({})'.format(start, finish, name, resource_type))
+  for name, target, verdict, saved, note in analysis['depends_on']:
+    detail = '{}, removing it would save {}s'.format(note, saved) if verdict == CRITICAL else note
+    print('  DependsOn {} -> {}: {}, {}'.format(name, target, verdict, detail))
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Report the critical path and unneeded DependsOn edges of CloudFormation templates.')
+  parser.add_argument('templates', nargs='+', help='Template files to analyze.')
+  parser.add_argument('--create-seconds', metavar='JSON', help='JSON file of {resource type: seconds} overriding the default create times.')
+  args = parser.parse_args(argv)
+  create_seconds = None
+  if args.create_seconds:
+    with open(args.create_seconds) as file:
+      create_seconds = json.load(file)
+  findings = 0
+  for path in args.templates:
+    analysis = analyzeTemplate(loadTemplateFile(path), create_seconds)
+    printAnalysis(path, analysis)
+    findings += sum(1 for finding in analysis['depends_on'] if finding[2] in (REDUNDANT, CRITICAL))
+  return 1 if findings else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,197 @@
+import argparse
+import datetime
+import json
+import sys
+from dependency_analyzer import DependencyGraph, RESOURCE_CREATE_SECONDS, DEFAULT_CREATE_SECONDS
+from template_graph import templateData, loadTemplateFile, resourceReferences
+
+# Predicts how long creating or updating a stack takes from its template alone. Every resource gets
+# an action, create for new resources and update, replace or nothing for resources of a previous
+# template, and the latency of that action for its type. The dependency graph is then simulated
+# with unlimited parallelism; resources that replace others are followed by a cleanup phase that
+# deletes the old ones. Latencies come from LATENCY_SECONDS, a JSON file overriding it, or a table
+# calibrated from recorded stack events (aws cloudformation describe-stack-events output).
+
+CREATE = 'create'
+UPDATE = 'update'
+REPLACE = 'replace'
+DELETE = 'delete'
+UNCHANGED = 'unchanged'
+ACTIONS = [CREATE, UPDATE, REPLACE, DELETE]
+
+DEFAULT_LATENCY_SECONDS = {CREATE: DEFAULT_CREATE_SECONDS, UPDATE: DEFAULT_CREATE_SECONDS, REPLACE: DEFAULT_CREATE_SECONDS, DELETE: DEFAULT_CREATE_SECONDS}
+LATENCY_SECONDS = dict((resource_type, {CREATE: seconds, UPDATE: DEFAULT_CREATE_SECONDS, REPLACE: seconds, DELETE: DEFAULT_CREATE_SECONDS}) for resource_type, seconds in RESOURCE_CREATE_SECONDS.items())
+LATENCY_SECONDS['AWS::CloudFormation::Stack'].update({UPDATE: 30, DELETE: 30})
+LATENCY_SECONDS['AWS::EC2::NatGateway'].update({DELETE: 60})
+LATENCY_SECONDS['AWS::EC2::VPC'].update({DELETE: 15})
+LATENCY_SECONDS['AWS::ElastiCache::CacheCluster'].update({UPDATE: 600, DELETE: 300})
+LATENCY_SECONDS['AWS::ElastiCache::ReplicationGroup'].update({UPDATE: 900, DELETE: 420})
+LATENCY_SECONDS['AWS::ElasticLoadBalancingV2::LoadBalancer'].update({UPDATE: 30, DELETE: 60})
+LATENCY_SECONDS['AWS::RDS::DBCluster'].update({UPDATE: 300, DELETE: 420})
+LATENCY_SECONDS['AWS::RDS::DBInstance'].update({UPDATE: 600, DELETE: 480})
+
+# Properties whose change makes CloudFormation replace the resource instead of updating it.
+REPLACEMENT_PROPERTIES = {
+  'AWS::EC2::EIP': ['Domain'],
+  'AWS::EC2::NatGateway': ['AllocationId', 'SubnetId'],
+  'AWS::EC2::Route': ['DestinationCidrBlock', 'RouteTableId'],
+  'AWS::EC2::RouteTable': ['VpcId'],
+  'AWS::EC2::Subnet': ['AvailabilityZone', 'CidrBlock', 'VpcId'],
+  'AWS::EC2::SubnetRouteTableAssociation': ['SubnetId'],
+  'AWS::EC2::VPC': ['CidrBlock', 'InstanceTenancy'],
+  'AWS::EC2::VPCGatewayAttachment': ['InternetGatewayId', 'VpcId'],
+  'AWS::ElastiCache::CacheCluster': ['CacheSubnetGroupName', 'ClusterName', 'Engine', 'Port', 'PreferredAvailabilityZone'],
+  'AWS::ElastiCache::ReplicationGroup': ['AtRestEncryptionEnabled', 'CacheSubnetGroupName', 'Engine', 'Port', 'ReplicationGroupId', 'TransitEncryptionEnabled'],
+  'AWS::ElastiCache::SubnetGroup': ['CacheSubnetGroupName'],
+  'AWS::ElasticLoadBalancingV2::LoadBalancer': ['Name', 'Scheme', 'Type'],
+  'AWS::ElasticLoadBalancingV2::Listener': ['LoadBalancerArn'],
+  'AWS::ElasticLoadBalancingV2::TargetGroup': ['Name', 'Port', 'Protocol', 'TargetType', 'VpcId'],
+  'AWS::RDS::DBCluster': ['AvailabilityZones', 'DBClusterIdentifier', 'DBSubnetGroupName', 'Engine', 'KmsKeyId', 'MasterUsername', 'StorageEncrypted'],
+  'AWS::RDS::DBInstance': ['AvailabilityZone', 'DBClusterIdentifier', 'DBInstanceIdentifier', 'DBName', 'DBSubnetGroupName', 'KmsKeyId', 'StorageEncrypted'],
+  'AWS::RDS::DBSubnetGroup': ['DBSubnetGroupName'],
+}
+
+def loadLatencies(path):
+  # LATENCY_SECONDS with the {resource type: {action: seconds}} entries of a JSON file merged in.
+  latencies = dict((resource_type, dict(seconds)) for resource_type, seconds in LATENCY_SECONDS.items())
+  if path:
+    with open(path) as file:
+      for resource_type, seconds in json.load(file).items():
+        latencies.setdefault(resource_type, dict(DEFAULT_LATENCY_SECONDS)).update(seconds)
+  return latencies
+
+def latency(latencies, resource_type, action):
+  return latencies.get(resource_type, DEFAULT_LATENCY_SECONDS).get(action, DEFAULT_LATENCY_SECONDS[action])
+
+def resourceAction(resource, previous):
+  if previous is None:
+    return CREATE
+  if previous == resource:
+    return UNCHANGED
+  if previous.get('Type') != resource.get('Type'):
+    return REPLACE
+  properties = resource.get('Properties', {})
+  previous_properties = previous.get('Properties', {})
+  if any(properties.get(name) != previous_properties.get(name) for name in REPLACEMENT_PROPERTIES.get(resource.get('Type'), [])):
+    return REPLACE
+  return UPDATE
+
+def planActions(template_data, previous_data=None):
+  # {resource: action} for the resources of template_data, plus DELETE for the ones only in
+  # previous_data. Unchanged resources that refer to a replaced resource see a new physical id and
+  # are updated as well.
+  resources = template_data.get('Resources', {})
+  previous_resources = (previous_data or {}).get('Resources', {})
+  actions = dict((name, resourceAction(resource, previous_resources.get(name) if previous_data is not None else None)) for name, resource in resources.items())
+  references = resourceReferences(template_data)
+  for name in resources:
+    if actions[name] == UNCHANGED and any(actions[target] == REPLACE for target in references[name]):
+      actions[name] = UPDATE
+  for name in previous_resources:
+    if name not in resources:
+      actions[name] = DELETE
+  return actions
+
+def estimateDeploy(template, previous_template=None, latencies=None):
+  template_data = templateData(template)
+  previous_data = templateData(previous_template) if previous_template is not None else None
+  latencies = latencies or LATENCY_SECONDS
+  actions = planActions(template_data, previous_data)
+  graph = DependencyGraph(template_data)
+  for name in graph.names:
+    graph.seconds[name] = 0 if actions[name] == UNCHANGED else latency(latencies, graph.types[name], actions[name])
+  times = graph.schedule()
+  previous_resources = (previous_data or {}).get('Resources', {})
+  cleanup = [latency(latencies, previous_resources[name].get('Type'), DELETE) for name, action in actions.items() if action in (REPLACE, DELETE) and name in previous_resources]
+  return {
+    'seconds': graph.totalSeconds(),
+    'cleanup_seconds': max(cleanup or [0]),
+    'actions': actions,
+    'critical_path': [(name, graph.types[name], actions[name], times[name][0], times[name][1]) for name in graph.criticalPath() if times[name][1] > times[name][0]],
+  }
+
+def parseTimestamp(value):
+  return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def eventDurations(events):
+  # [(resource type, action, seconds)] for every resource operation in a describe-stack-events
+  # response that ran to completion. The events of the stack itself are skipped.
+  started = {}
+  durations = []
+  for event in sorted(events, key=lambda event: parseTimestamp(event['Timestamp'])):
+    if event.get('PhysicalResourceId') == event.get('StackId') or event.get('LogicalResourceId') == event.get('StackName'):
+      continue
+    key = event['LogicalResourceId']
+    status = event['ResourceStatus']
+    operation, _, state = status.partition('_')
+    if state == 'IN_PROGRESS':
+      action = operation.lower()
+      if operation == 'UPDATE' and 'creation of a new physical resource' in event.get('ResourceStatusReason', ''):
+        action = REPLACE
+      previous = started.get(key)
+      if previous is not None and operation == 'UPDATE' and previous[0] in (UPDATE, REPLACE):
+        # A replacement is announced by the first UPDATE_IN_PROGRESS event and followed by more of
+        # them; it stays a replacement timed from the first one.
+        started[key] = (REPLACE if REPLACE in (previous[0], action) else UPDATE, previous[1])
+      elif previous is None or previous[0] != action:
+        started[key] = (action, parseTimestamp(event['Timestamp']))
+    elif state == 'COMPLETE' and key in started:
+      action, start = started.pop(key)
+      if action.upper() == operation or (action == REPLACE and operation == 'UPDATE'):
+        durations.append((event['ResourceType'], action, (parseTimestamp(event['Timestamp']) - start).total_seconds()))
+    elif state == 'FAILED':
+      started.pop(key, None)
+  return durations
+
+def calibrateLatencies(event_files):
+  # {resource type: {action: median seconds}} over the stack events in event_files.
+  samples = {}
+  for path in event_files:
+    with open(path) as file:
+      events = json.load(file)
+    for resource_type, action, seconds in eventDurations(events.get('StackEvents', events) if isinstance(events, dict) else events):
+      samples.setdefault(resource_type, {}).setdefault(action, []).append(seconds)
+  calibrated = {}
+  for resource_type, actions in samples.items():
+    for action, values in actions.items():
+      values = sorted(values)
+      middle = len(values) // 2
+      median = values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+      calibrated.setdefault(resource_type, {})[action] = round(median, 1)
+  return calibrated
+
+def formatDuration(seconds):
+  seconds = int(round(seconds))
+  return '{}m{:02d}s'.format(seconds // 60, seconds % 60)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Estimate how long deploying CloudFormation templates takes.')
+  parser.add_argument('templates', nargs='*', help='Template files to estimate.')
+  parser.add_argument('--previous', metavar='TEMPLATE', help='Deployed template to estimate an update from. Only valid with a single template.')
+  parser.add_argument('--latencies', metavar='JSON', help='JSON file of {resource type: {action: seconds}} overriding the default latencies.')
+  parser.add_argument('--calibrate', metavar='EVENTS', nargs='+', help='describe-stack-events JSON files to calibrate latencies from. The table is written to --latencies.')
+  args = parser.parse_args(argv)
+  if args.calibrate:
+    if not args.latencies:
+      parser.error('--calibrate needs --latencies to write the table to')
+    with open(args.latencies, 'w') as file:
+      json.dump(calibrateLatencies(args.calibrate), file, indent=2, sort_keys=True)
+    return 0
+  if not args.templates:
+    parser.error('no templates given')
+  if args.previous and len(args.templates) != 1:
+    parser.error('--previous needs exactly one template')
+  latencies = loadLatencies(args.latencies)
+  previous_template = loadTemplateFile(args.previous) if args.previous else None
+  for path in args.templates:
+    estimate = estimateDeploy(loadTemplateFile(path), previous_template, latencies)
+    counts = {}
+    for action in estimate['actions'].values():
+      counts[action] = counts.get(action, 0) + 1
+    print('{}: {} ({}), then {} cleanup'.format(path, formatDuration(estimate['seconds']), ', '.join('{} {}'.format(counts[action], action) for action in ACTIONS + [UNCHANGED] if action in counts), formatDuration(estimate['cleanup_seconds'])))
+    for name, resource_type, action, start, finish in estimate['critical_path']:
+      print('  {:>7} {:>7}  {:<8} {} ({})'.format(formatDuration(start), formatDuration(finish), action, name, resource_type))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
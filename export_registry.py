@@ -0,0 +1,125 @@
+import re
+from template_graph import findReferences
+
+# Names of the values stacks share through Outputs exports and Fn::ImportValue. A stack exports
+# ${AWS::StackName}-<name> and consumers import ${<stack name parameter>}-<name>, so both sides are
+# built from the same ExportName instead of repeating the string.
+# ExportIndex reads rendered templates back, indexes every export by name and resolves every
+# import against it, which gives the build the dependencies between stacks and a deploy order.
+
+EXPORTS = {}
+EXPORT_NAME = re.compile(r'^\$\{AWS::StackName\}-(.+)$')
+IMPORT_NAME = re.compile(r'^\$\{([^}]+)\}-(.+)$')
+
+class ExportName(object):
+
+  def __init__(self, name, resource_type):
+    self.name = name
+    self.resource_type = resource_type
+    EXPORTS[name] = self
+
+  def export(self):
+    from troposphere import Export, Sub
+    return Export(Sub("${AWS::StackName}-" + self.name))
+
+  def output(self, value, title=None):
+    from troposphere import Output
+    return Output(title or self.name, Value=value, Export=self.export())
+
+  def importValue(self, stack_parameter):
+    from troposphere import ImportValue, Sub
+    return ImportValue(Sub("${" + stack_parameter.title + "}-" + self.name))
+
+RDS_SUBNET_GROUP = ExportName('RDSSubnetGroup', 'AWS::RDS::DBSubnetGroup')
+ELASTICACHE_SUBNET_GROUP = ExportName('ElastiCacheSubnetGroup', 'AWS::ElastiCache::SubnetGroup')
+PRIVATE_SUBNETS = ExportName('PrivateSubnets', 'AWS::EC2::Subnet')
+AURORA_ENDPOINT = ExportName('AuroraEndpoint', 'AWS::RDS::DBCluster')
+AURORA_READER_ENDPOINT = ExportName('AuroraReaderEndpoint', 'AWS::RDS::DBCluster')
+AURORA_PORT = ExportName('AuroraPort', 'AWS::RDS::DBCluster')
+ALB = ExportName('ALB', 'AWS::ElasticLoadBalancingV2::LoadBalancer')
+ALB_DNS_NAME = ExportName('DNSName', 'AWS::ElasticLoadBalancingV2::LoadBalancer')
+ALB_FULL_NAME = ExportName('LoadBalancerFullName', 'AWS::ElasticLoadBalancingV2::LoadBalancer')
+TARGET_GROUP = ExportName('TargetGroup', 'AWS::ElasticLoadBalancingV2::TargetGroup')
+TARGET_GROUP_FULL_NAME = ExportName('TargetGroupFullName', 'AWS::ElasticLoadBalancingV2::TargetGroup')
+HTTP_LISTENER = ExportName('HTTPListener', 'AWS::ElasticLoadBalancingV2::Listener')
+
+def _subText(value):
+  if isinstance(value, dict) and 'Fn::Sub' in value:
+    argument = value['Fn::Sub']
+    return argument if isinstance(argument, str) else argument[0]
+  return None
+
+def _imports(value, location):
+  if isinstance(value, dict):
+    if 'Fn::ImportValue' in value:
+      match = IMPORT_NAME.match(_subText(value['Fn::ImportValue']) or '')
+      if match:
+        yield location, match.group(1), match.group(2)
+      return
+    for key, item in value.items():
+      for found in _imports(item, location):
+        yield found
+  elif isinstance(value, list):
+    for item in value:
+      for found in _imports(item, location):
+        yield found
+
+class ExportIndex(object):
+
+  def __init__(self):
+    self.exports = {}
+    self.imports = []
+    self.problems = []
+    self.stacks = []
+
+  def addTemplate(self, stack, template_data):
+    # Indexes the exports and imports of one rendered template of stack.
+    if stack not in self.stacks:
+      self.stacks.append(stack)
+    resources = template_data.get('Resources', {})
+    for output_name, output in template_data.get('Outputs', {}).items():
+      match = EXPORT_NAME.match(_subText(output.get('Export', {}).get('Name')) or '')
+      if not match:
+        continue
+      name = match.group(1)
+      targets = [target for target, _ in findReferences(output.get('Value')) if target in resources]
+      resource_type = resources[targets[0]].get('Type') if targets else None
+      if name in self.exports and self.exports[name][0] != stack:
+        self.problems.append('{} exports {}, which {} already exports'.format(stack, name, self.exports[name][0]))
+        continue
+      self.exports[name] = (stack, output_name, resource_type)
+      declared = EXPORTS.get(name)
+      if declared is None:
+        self.problems.append('{} exports {}, which is not a registered export name'.format(stack, name))
+      elif resource_type is not None and resource_type != declared.resource_type:
+        self.problems.append('{} exports {} from a {}, expected a {}'.format(stack, name, resource_type, declared.resource_type))
+    for name, resource in resources.items():
+      for location, parameter, export_name in _imports(resource, name):
+        self.imports.append((stack, location, parameter, export_name))
+
+  def resolve(self):
+    # Returns {stack: set of stacks it imports from}; imports nothing exports are added to problems.
+    dependencies = dict((stack, set()) for stack in self.stacks)
+    for stack, location, parameter, name in self.imports:
+      exported = self.exports.get(name)
+      if exported is None:
+        self.problems.append('{}: {} imports {} through {}, which no stack exports'.format(stack, location, name, parameter))
+      elif exported[0] != stack:
+        dependencies[stack].add(exported[0])
+    return dependencies
+
+def deployOrder(dependencies):
+  # Stacks grouped in waves: every stack only imports from stacks of earlier waves, so the stacks
+  # of a wave can be deployed in parallel.
+  remaining = dict((stack, set(imported) & set(dependencies)) for stack, imported in dependencies.items())
+  waves = []
+  while remaining:
+    wave = sorted(stack for stack, imported in remaining.items() if not imported)
+    if not wave:
+      raise ValueError('Stacks import from each other: ' + ', '.join(sorted(remaining)))
+    waves.append(wave)
+    for stack in wave:
+      del remaining[stack]
+    for imported in remaining.values():
+      imported.difference_update(wave)
+  return waves
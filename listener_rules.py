@@ -0,0 +1,138 @@
+import fnmatch
+import json
+import os
+
+# Compiles a routing table of {'host', 'path', 'target'} routes into ALB listener rules. Routes to
+# the same target are merged into rules with multi-value conditions, and priorities are assigned
+# so that rules with the most traffic are evaluated first. Of two overlapping rules to different
+# targets the more specific one, or else the one listed first, is evaluated first, so reordering
+# never changes where a request goes.
+# host and path are ALB patterns ('*' and '?' wildcards); a missing host or path matches anything.
+# Hit counts are read from a JSON file of {routeKey(route): requests}.
+
+LISTENER_RULE_LIMIT = 100
+CONDITION_VALUE_LIMIT = 5
+
+def routeKey(route):
+  return (route.get('host') or '*') + (route.get('path') or '')
+
+def loadHitCounts(path):
+  if not path or not os.path.exists(path):
+    return {}
+  with open(path) as file:
+    return json.load(file)
+
+def _matches(pattern, value):
+  return pattern is None or fnmatch.fnmatchcase(value, pattern)
+
+def matchRoute(rules, host, path):
+  # The route of the compiled rules a request is sent to, or None for the default action.
+  host = host.lower()
+  for rule in rules:
+    for route in rule.routes:
+      if _matches(route.get('host'), host) and _matches(route.get('path'), path):
+        return route
+  return None
+
+def _patternsOverlap(first, second):
+  # Whether some value can match both patterns. Exact for patterns without wildcards, conservative
+  # (True) when both sides contain wildcards that could meet.
+  if first is None or second is None or first == second:
+    return True
+  if not any(character in first for character in '*?'):
+    return fnmatch.fnmatchcase(first, second)
+  if not any(character in second for character in '*?'):
+    return fnmatch.fnmatchcase(second, first)
+  prefix = min(len(first.split('*')[0].split('?')[0]), len(second.split('*')[0].split('?')[0]))
+  return first[:prefix] == second[:prefix]
+
+def _specificity(pattern):
+  # Patterns without a condition are the least specific, then by length of the literal prefix.
+  if pattern is None:
+    return -1
+  literal = pattern.split('*')[0].split('?')[0]
+  return len(literal) + (1000 if literal == pattern else 0)
+
+class ListenerRule(object):
+
+  def __init__(self, target, hosts, paths, routes, index):
+    self.index = index
+    self.target = target
+    self.hosts = hosts
+    self.paths = paths
+    self.routes = routes
+    self.hits = 0
+    self.priority = None
+
+  def overlaps(self, other):
+    return (any(_patternsOverlap(first, second) for first in self.hosts or [None] for second in other.hosts or [None]) and
+      any(_patternsOverlap(first, second) for first in self.paths or [None] for second in other.paths or [None]))
+
+  def specificity(self):
+    return (min(_specificity(host) for host in self.hosts or [None]), min(_specificity(path) for path in self.paths or [None]))
+
+  def __repr__(self):
+    return 'ListenerRule({!r}, {!r}, {!r}, priority={!r}, hits={!r})'.format(self.target, self.hosts, self.paths, self.priority, self.hits)
+
+def _chunks(values, size):
+  return [values[index:index + size] for index in range(0, len(values), size)] or [[]]
+
+def mergeRoutes(routes):
+  # Routes to the same target with the same path become one rule with several hosts, and rules to
+  # the same target with the same hosts are then merged on path. Host and path values of a rule
+  # stay within CONDITION_VALUE_LIMIT together.
+  by_path = {}
+  for index, route in enumerate(routes):
+    if not route.get('host') and not route.get('path'):
+      raise ValueError("Route to {} matches every request, make it the listener's default action instead".format(route['target']))
+    route = dict(route, index=index, host=route.get('host').lower() if route.get('host') else None)
+    by_path.setdefault((route['target'], route.get('path')), []).append(route)
+  by_hosts = {}
+  for (target, path), grouped in by_path.items():
+    hosts = tuple(sorted(set(route.get('host') for route in grouped if route.get('host'))))
+    if any(not route.get('host') for route in grouped):
+      hosts = ()
+    entry = by_hosts.setdefault((target, hosts), ([], []))
+    entry[0].append(path)
+    entry[1].extend(grouped)
+  rules = []
+  for (target, hosts), (paths, grouped) in sorted(by_hosts.items(), key=lambda item: (item[0][0], item[0][1])):
+    paths = sorted(set(paths), key=lambda path: (path is None, path))
+    if None in paths:
+      paths = [None]
+    host_chunk = max(1, CONDITION_VALUE_LIMIT - (1 if paths != [None] else 0))
+    for host_values in _chunks(list(hosts), host_chunk):
+      path_chunk = max(1, CONDITION_VALUE_LIMIT - len(host_values))
+      for path_values in _chunks([path for path in paths if path is not None], path_chunk):
+        rule_routes = [route for route in grouped if (not host_values or route.get('host') in host_values or not route.get('host')) and (not path_values or route.get('path') in path_values)]
+        rules.append(ListenerRule(target, list(host_values), list(path_values), rule_routes, min(route['index'] for route in rule_routes)))
+  return rules
+
+def compileListenerRules(routes, hit_counts=None, limit=LISTENER_RULE_LIMIT):
+  # Returns the merged rules ordered by priority (1 first). Raises ValueError when more than limit
+  # rules are needed.
+  hit_counts = hit_counts or {}
+  rules = mergeRoutes(routes)
+  if len(rules) > limit:
+    raise ValueError("{} listener rules needed, the listener allows {}".format(len(rules), limit))
+  for rule in rules:
+    rule.hits = sum(hit_counts.get(routeKey(route), 0) for route in rule.routes)
+  # A rule has to come after the more specific rules it overlaps with that send traffic elsewhere,
+  # and after the ones listed before it in the routing table when neither is more specific.
+  before = dict((rule, set()) for rule in rules)
+  for rule in rules:
+    for other in rules:
+      if other is not rule and other.target != rule.target and rule.overlaps(other):
+        if (other.specificity(), -other.index) > (rule.specificity(), -rule.index):
+          before[rule].add(other)
+  ordered = []
+  remaining = list(rules)
+  while remaining:
+    ready = [rule for rule in remaining if not before[rule] - set(ordered)]
+    if not ready:
+      raise ValueError("Conflicting routes: " + ", ".join(repr(rule) for rule in remaining))
+    rule = max(ready, key=lambda rule: (rule.hits, rule.specificity()))
+    rule.priority = len(ordered) + 1
+    ordered.append(rule)
+    remaining.remove(rule)
+  return ordered
@@ -1,115 +1,112 @@
-from troposphere import Base64, FindInMap, GetAtt, Join, Output, Sub, Export
-from troposphere import Parameter, Ref, Template
-import troposphere.ec2 as ec2
-import troposphere.elasticloadbalancingv2 as elb
+import os
+from stack_registry import ROOT, registerStack, writeStack
 
-alb_listener = Template()
-alb_listener.add_version("2010-09-09")
-alb_listener.add_description("ALB listeners stack. Contains ALB listeners and listener rules.")
+# Routing table of the HTTP listener. Each route sends the requests matching its host and path
+# patterns to the target group of its target, every other request goes to DEFAULT_TARGET. Routes
+# are compiled into listener rules by listener_rules, in order of the hits recorded in HITS_FILE.
+ROUTES = [
+  {'host': 'discuss.courses.ucsd.edu', 'target': 'EdxPlatform'},
+]
+DEFAULT_TARGET = 'EdxPlatform'
+HITS_FILE = 'listener_hits.json'
 
-# alb_listener_alb_arn_parameter = alb_listener.add_parameter(
-#   Parameter(
-#     'ALBArn',
-#     Default="",
-#     Description="ARN for ALB.",
-#     Type="String"
-#   )
-# )
+@registerStack("Listeners", "Listeners.yaml", inputs=[HITS_FILE])
+def createListenersTemplate(routes=ROUTES, default_target=DEFAULT_TARGET, hits_file=os.path.join(ROOT, HITS_FILE)):
+  from troposphere import Output, Sub, Export
+  from troposphere import Parameter, Ref, Template
+  import troposphere.elasticloadbalancingv2 as elb
+  from export_registry import ALB, TARGET_GROUP, HTTP_LISTENER
+  from alb_functions import createListenerRules
+  from listener_rules import compileListenerRules, loadHitCounts
 
-# alb_listener_tg_arn_parameter = alb_listener.add_parameter(
-#   Parameter(
-#     'TGArn',
-#     Default="",
-#     Description="ARN for ALB.",
-#     Type="String"
-#   )
-# )
+  alb_listener = Template()
+  alb_listener.add_version("2010-09-09")
+  alb_listener.add_description("ALB listeners stack. Contains ALB listeners and listener rules.")
 
-alb_listener_http_resource = alb_listener.add_resource(
-  elb.Listener(
-    "HTTPListener",
-    Port=80,
-    Protocol="HTTP",
-    LoadBalancerArn="arn:aws:elasticloadbalancing:us-west-2:486807960363:loadbalancer/app/ucsd-prod-alb/018c81eaca819d8b",
-    DefaultActions=[
-      elb.Action(
-        Type="forward",
-        TargetGroupArn="arn:aws:elasticloadbalancing:us-west-2:486807960363:targetgroup/UCSD-Prod-edX-Platform-TG/96de5fa2f23209c5",
-      )
-    ]
+  alb_listener_alb_stack_parameter = alb_listener.add_parameter(
+    Parameter(
+      'ALBStackName',
+      Description="Stack name containing the exported ALB.",
+      Type="String"
+    )
   )
-)
-
-# alb_listener_https_resource = alb_listener.add_resource(
-#   elb.Listener(
-#     "HTTPSListener",
-#     Port=443,
-#     Protocol="HTTPS",
-#     LoadBalancerArn=Sub("${" + alb_listener_alb_arn_parameter.title + "}-ALB"),
-#     DefaultActions=[
-#       elb.Action(
-#         Type="forward",
-#         TargetGroupArn=Sub("${" + alb_listener_tg_arn_parameter.title + "}-TargetGroup"),
-#       )
-#     ]
-#   )
-# )
 
-alb_listener_http_rule_resource = alb_listener.add_resource(
-  elb.ListenerRule(
-    "HTTPListenerRule",
-    ListenerArn=Ref(alb_listener_http_resource),
-    Conditions=[
-      elb.Condition(
-        Field="host-header",
-        Values=[ "discuss.courses.ucsd.edu" ]
+  # One stack name parameter per target, for the target group it exports.
+  target_group_arns = {}
+  for target in sorted(set([default_target] + [route['target'] for route in routes])):
+    target_stack_parameter = alb_listener.add_parameter(
+      Parameter(
+        target + 'TargetGroupStackName',
+        Description="Stack name containing the exported target group of " + target + ".",
+        Type="String"
       )
-    ],
-    Actions=[
-      elb.Action(
-        Type="forward",
-        TargetGroupArn="arn:aws:elasticloadbalancing:us-west-2:486807960363:targetgroup/UCSD-Prod-edX-Platform-TG/96de5fa2f23209c5"
-      )
-    ],
-    Priority=1
+    )
+    target_group_arns[target] = TARGET_GROUP.importValue(target_stack_parameter)
+
+  alb_listener_http_resource = alb_listener.add_resource(
+    elb.Listener(
+      "HTTPListener",
+      Port=80,
+      Protocol="HTTP",
+      LoadBalancerArn=ALB.importValue(alb_listener_alb_stack_parameter),
+      DefaultActions=[
+        elb.Action(
+          Type="forward",
+          TargetGroupArn=target_group_arns[default_target],
+        )
+      ]
+    )
   )
-)
 
-# alb_listener_https_rule_resource = alb_listener.add_resource(
-#   elb.ListenerRule(
-#     "HTTPSListenerRule",
-#     ListenerArn=Ref(alb_listener_https_resource),
-#     Conditions=[
-#       elb.Condition(
-#         Field="host-header",
-#         Values=[ "discuss.courses.ucsd.edu" ]
-#       )
-#     ],
-#     Actions=[
-#       elb.Action(
-#         Type="forward",
-#         TargetGroupArn=Ref(alb_listener_tg_arn_parameter)
-#       )
-#     ],
-#     Priority=1
-#   )
-# )
+  # alb_listener_https_resource = alb_listener.add_resource(
+  #   elb.Listener(
+  #     "HTTPSListener",
+  #     Port=443,
+  #     Protocol="HTTPS",
+  #     LoadBalancerArn=Sub("${" + alb_listener_alb_arn_parameter.title + "}-ALB"),
+  #     DefaultActions=[
+  #       elb.Action(
+  #         Type="forward",
+  #         TargetGroupArn=Sub("${" + alb_listener_tg_arn_parameter.title + "}-TargetGroup"),
+  #       )
+  #     ]
+  #   )
+  # )
 
-alb_listener_http_resource_output = alb_listener.add_output(
-  Output(
-    alb_listener_http_resource.title,
-    Value=Ref(alb_listener_http_resource),
-    Export=Export(Sub("${AWS::StackName}-" + alb_listener_http_resource.title))
-  )
-)
+  alb_listener_http_rules = compileListenerRules(routes, loadHitCounts(hits_file))
+  alb_listener_http_rule_resources = createListenerRules(alb_listener, alb_listener_http_resource, alb_listener_http_rules, target_group_arns)
+
+  # alb_listener_https_rule_resource = alb_listener.add_resource(
+  #   elb.ListenerRule(
+  #     "HTTPSListenerRule",
+  #     ListenerArn=Ref(alb_listener_https_resource),
+  #     Conditions=[
+  #       elb.Condition(
+  #         Field="host-header",
+  #         Values=[ "discuss.courses.ucsd.edu" ]
+  #       )
+  #     ],
+  #     Actions=[
+  #       elb.Action(
+  #         Type="forward",
+  #         TargetGroupArn=Ref(alb_listener_tg_arn_parameter)
+  #       )
+  #     ],
+  #     Priority=1
+  #   )
+  # )
+
+  alb_listener_http_resource_output = alb_listener.add_output(HTTP_LISTENER.output(Ref(alb_listener_http_resource)))
+
+  # alb_listener_https_resource_output = alb_listener.add_output(
+  #   Output(
+  #     alb_listener_https_resource.title,
+  #     Value=Ref(alb_listener_https_resource),
+  #     Export=Export(Sub("${AWS::StackName}-" + alb_listener_https_resource.title))
+  #   )
+  # )
 
-# alb_listener_https_resource_output = alb_listener.add_output(
-#   Output(
-#     alb_listener_https_resource.title,
-#     Value=Ref(alb_listener_https_resource),
-#     Export=Export(Sub("${AWS::StackName}-" + alb_listener_https_resource.title))
-#   )
-# )
+  return alb_listener
 
-with open("Listeners.yaml", "w") as file:
-  file.write(alb_listener.to_yaml())
\ No newline at end of file
+if __name__ == "__main__":
+  writeStack("Listeners")
@@ -0,0 +1,134 @@
+import json
+from troposphere import Equals, If, Not, Parameter, Ref, Sub
+from troposphere.cloudwatch import Alarm as CloudWatchAlarm, Dashboard, MetricDimension
+from troposphere.validators import integer
+
+if 'DatapointsToAlarm' in CloudWatchAlarm.props:
+  Alarm = CloudWatchAlarm
+else:
+  # Older troposphere releases, the pinned 2.3.4 among them, do not know DatapointsToAlarm.
+  class Alarm(CloudWatchAlarm):
+    props = dict(CloudWatchAlarm.props, DatapointsToAlarm=(integer, False))
+
+# CloudWatch alarms and dashboards for an ALB and its target groups. Thresholds come from the SLO of
+# the service behind a target group; every threshold is per period:
+#   latency_p99           seconds, p99 of TargetResponseTime
+#   requests_per_target   RequestCountPerTarget the targets are sized for
+#   target_5xx            HTTPCode_Target_5XX_Count
+#   elb_5xx               HTTPCode_ELB_5XX_Count, requests the ALB failed itself
+#   rejected_connections  RejectedConnectionCount, connections refused at the ALB's limit
+# An alarm fires when datapoints_to_alarm of the last evaluation_periods periods breach.
+
+NAMESPACE = "AWS/ApplicationELB"
+
+DEFAULT_SLO = {
+  'latency_p99': 1.0,
+  'requests_per_target': 1000,
+  'target_5xx': 10,
+  'elb_5xx': 10,
+  'rejected_connections': 0,
+  'period': 60,
+  'evaluation_periods': 5,
+  'datapoints_to_alarm': 3,
+}
+
+SERVICE_SLOS = {
+  'default': {},
+  # Course pages and the LMS API render server side.
+  'edx-platform': {'latency_p99': 2.0, 'requests_per_target': 600},
+  'discourse': {'latency_p99': 1.0},
+}
+
+def serviceSlo(name, **overrides):
+  if name not in SERVICE_SLOS:
+    raise ValueError("Unknown service {}, expected one of {}".format(name, ", ".join(sorted(SERVICE_SLOS))))
+  slo = dict(DEFAULT_SLO, **SERVICE_SLOS[name])
+  slo.update(overrides)
+  if slo['period'] not in (10, 30) and slo['period'] % 60:
+    raise ValueError("Alarm period must be 10, 30 or a multiple of 60 seconds, got {}".format(slo['period']))
+  if not 1 <= slo['datapoints_to_alarm'] <= slo['evaluation_periods']:
+    raise ValueError("datapoints_to_alarm must be between 1 and evaluation_periods ({}), got {}".format(slo['evaluation_periods'], slo['datapoints_to_alarm']))
+  return slo
+
+def createAlarmTopicParameter(template):
+  # Adds the AlarmTopicArn parameter and returns the AlarmActions value for it: the topic, or no
+  # actions when the parameter is left empty.
+  alarm_topic_parameter = template.add_parameter(
+    Parameter(
+      'AlarmTopicArn',
+      Default="",
+      Description="SNS topic the alarms notify. Leave empty for alarms without actions.",
+      Type="String"
+    )
+  )
+  template.add_condition("HasAlarmTopic", Not(Equals(Ref(alarm_topic_parameter), "")))
+  return If("HasAlarmTopic", [Ref(alarm_topic_parameter)], Ref("AWS::NoValue"))
+
+def _dimensions(load_balancer, target_group=None):
+  dimensions = [MetricDimension(Name="LoadBalancer", Value=load_balancer)]
+  if target_group is not None:
+    dimensions.insert(0, MetricDimension(Name="TargetGroup", Value=target_group))
+  return dimensions
+
+def createMetricAlarm(title, description, metric_name, dimensions, threshold, slo, alarm_actions, statistic="Sum"):
+  # Statistics of the form pNN are percentiles. Periods without data do not breach.
+  statistic_property = "ExtendedStatistic" if statistic.startswith('p') else "Statistic"
+  return Alarm(
+    title,
+    AlarmDescription=description,
+    AlarmActions=alarm_actions,
+    Namespace=NAMESPACE,
+    Dimensions=dimensions,
+    ComparisonOperator="GreaterThanThreshold",
+    MetricName=metric_name,
+    EvaluationPeriods=str(slo['evaluation_periods']),
+    DatapointsToAlarm=str(slo['datapoints_to_alarm']),
+    Period=str(slo['period']),
+    Threshold=str(threshold),
+    TreatMissingData="notBreaching",
+    **{statistic_property: statistic}
+  )
+
+def createTargetGroupAlarms(template, load_balancer, target_group, slo, alarm_actions, prefix="TargetGroup"):
+  # load_balancer and target_group are the LoadBalancerFullName and TargetGroupFullName values the
+  # metrics are dimensioned by.
+  dimensions = _dimensions(load_balancer, target_group)
+  return [template.add_resource(alarm) for alarm in [
+    createMetricAlarm(prefix + "LatencyAlarm", "Target response time p99 above the SLO.", "TargetResponseTime", dimensions, slo['latency_p99'], slo, alarm_actions, statistic="p99"),
+    createMetricAlarm(prefix + "RequestCountPerTargetAlarm", "Requests per target above what the targets are sized for.", "RequestCountPerTarget", dimensions, slo['requests_per_target'], slo, alarm_actions),
+    createMetricAlarm(prefix + "Target5XXAlarm", "Targets answer with 5XX responses.", "HTTPCode_Target_5XX_Count", dimensions, slo['target_5xx'], slo, alarm_actions),
+  ]]
+
+def createLoadBalancerAlarms(template, load_balancer, slo, alarm_actions, prefix="ALB"):
+  dimensions = _dimensions(load_balancer)
+  return [template.add_resource(alarm) for alarm in [
+    createMetricAlarm(prefix + "RejectedConnectionAlarm", "The load balancer rejects connections at its connection limit.", "RejectedConnectionCount", dimensions, slo['rejected_connections'], slo, alarm_actions),
+    createMetricAlarm(prefix + "ELB5XXAlarm", "The load balancer answers with 5XX responses.", "HTTPCode_ELB_5XX_Count", dimensions, slo['elb_5xx'], slo, alarm_actions),
+  ]]
+
+def _widget(title, metrics, x, y, stat="Sum", threshold=None):
+  properties = {'title': title, 'metrics': metrics, 'period': 60, 'stat': stat, 'region': '${AWS::Region}', 'view': 'timeSeries'}
+  if threshold is not None:
+    properties['annotations'] = {'horizontal': [{'label': 'SLO', 'value': threshold}]}
+  return {'type': 'metric', 'x': x, 'y': y, 'width': 12, 'height': 6, 'properties': properties}
+
+def dashboardBody(slo):
+  # Dashboard JSON for Fn::Sub with the LoadBalancer and TargetGroup full names as variables.
+  load_balancer = ['LoadBalancer', '${LoadBalancer}']
+  target_group = ['TargetGroup', '${TargetGroup}'] + load_balancer
+  widgets = [
+    _widget('Target response time', [[NAMESPACE, 'TargetResponseTime'] + target_group + [{'stat': stat, 'label': stat}] for stat in ('p50', 'p95', 'p99')], 0, 0, stat='p99', threshold=slo['latency_p99']),
+    _widget('Requests', [[NAMESPACE, 'RequestCount'] + target_group, [NAMESPACE, 'RequestCountPerTarget'] + target_group + [{'yAxis': 'right'}]], 12, 0),
+    _widget('5XX responses', [[NAMESPACE, 'HTTPCode_Target_5XX_Count'] + target_group, [NAMESPACE, 'HTTPCode_ELB_5XX_Count'] + load_balancer], 0, 6, threshold=slo['target_5xx']),
+    _widget('Hosts', [[NAMESPACE, 'HealthyHostCount'] + target_group, [NAMESPACE, 'UnHealthyHostCount'] + target_group], 12, 6, stat='Maximum'),
+    _widget('Connections', [[NAMESPACE, 'ActiveConnectionCount'] + load_balancer, [NAMESPACE, 'NewConnectionCount'] + load_balancer, [NAMESPACE, 'RejectedConnectionCount'] + load_balancer], 0, 12),
+  ]
+  return json.dumps({'widgets': widgets}, sort_keys=True)
+
+def createDashboard(template, title, load_balancer, target_group, slo):
+  return template.add_resource(
+    Dashboard(
+      title,
+      DashboardBody=Sub(dashboardBody(slo), LoadBalancer=load_balancer, TargetGroup=target_group)
+    )
+  )
@@ -0,0 +1,122 @@
+import functools
+import importlib
+import inspect
+import json
+import time
+
+# Opt-in instrumentation of template construction. enableProfiling() wraps the helper functions in
+# vpc_functions, rds_functions and elasticache_functions, troposphere object construction,
+# Template.add_* and serialization; disableProfiling() restores the originals. Nothing is patched
+# until profiling is enabled, so a normal build pays nothing for it.
+# Timings are recorded per helper and per resource type, inclusive and self time, plus the net
+# bytes allocated while tracemalloc is tracing. The report is JSON; writeFoldedStacks() writes the
+# folded format flamegraph.pl and speedscope read.
+
+HELPER_MODULES = ['vpc_functions', 'rds_functions', 'elasticache_functions']
+
+_patches = []
+_calls = {}
+_folded = {}
+_stack = []
+_tracemalloc = None
+
+def _record(key, function):
+  def recorded(*args, **kwargs):
+    label = key(*args, **kwargs) if callable(key) else key
+    _stack.append([label, 0.0])
+    memory_before = _tracemalloc.get_traced_memory()[0] if _tracemalloc else 0
+    start = time.perf_counter()
+    try:
+      return function(*args, **kwargs)
+    finally:
+      elapsed = time.perf_counter() - start
+      allocated = _tracemalloc.get_traced_memory()[0] - memory_before if _tracemalloc else 0
+      frame = _stack.pop()
+      self_time = elapsed - frame[1]
+      if _stack:
+        _stack[-1][1] += elapsed
+      stats = _calls.setdefault(label, {'count': 0, 'seconds': 0.0, 'self_seconds': 0.0, 'allocated_bytes': 0})
+      stats['count'] += 1
+      stats['self_seconds'] += self_time
+      stats['allocated_bytes'] += allocated
+      if not any(outer[0] == label for outer in _stack):
+        stats['seconds'] += elapsed
+      path = ';'.join([outer[0] for outer in _stack] + [label])
+      _folded[path] = _folded.get(path, 0.0) + self_time
+  return recorded
+
+def _patch(owner, name, key):
+  original = getattr(owner, name)
+  wrapper = functools.wraps(original)(_record(key, original))
+  for attribute in ('cache_info', 'cache_clear'):
+    if hasattr(original, attribute):
+      setattr(wrapper, attribute, getattr(original, attribute))
+  setattr(owner, name, wrapper)
+  _patches.append((owner, name, original))
+
+def _resourceType(instance):
+  return getattr(instance, 'resource_type', None) or type(instance).__name__
+
+def enableProfiling(allocations=False):
+  global _tracemalloc
+  if _patches:
+    return
+  import troposphere
+  import template_writer
+  import template_sharding
+  for module_name in HELPER_MODULES:
+    module = importlib.import_module(module_name)
+    for name, value in list(vars(module).items()):
+      if callable(value) and not inspect.isclass(value) and getattr(value, '__module__', None) == module_name:
+        _patch(module, name, module_name + '.' + name)
+  _patch(troposphere.BaseAWSObject, '__init__', lambda instance, *args, **kwargs: 'construct:' + _resourceType(instance))
+  _patch(troposphere.Template, 'add_resource', lambda template, resource: 'add_resource:' + _resourceType(resource))
+  _patch(troposphere.Template, 'add_parameter', 'Template.add_parameter')
+  _patch(troposphere.Template, 'add_output', 'Template.add_output')
+  for name in ('to_dict', 'to_json', 'to_yaml'):
+    _patch(troposphere.Template, name, 'Template.' + name)
+  for name in ('dumpTemplate', 'writeTemplate'):
+    _patch(template_writer, name, 'template_writer.' + name)
+  for name in ('shardTemplate', 'writeShardedTemplate'):
+    _patch(template_sharding, name, 'template_sharding.' + name)
+  if allocations:
+    import tracemalloc
+    tracemalloc.start()
+    _tracemalloc = tracemalloc
+
+def disableProfiling():
+  global _tracemalloc
+  while _patches:
+    owner, name, original = _patches.pop()
+    setattr(owner, name, original)
+  if _tracemalloc:
+    _tracemalloc.stop()
+    _tracemalloc = None
+
+def resetProfiling():
+  _calls.clear()
+  _folded.clear()
+
+def profilingReport():
+  return {'calls': dict((key, dict(stats)) for key, stats in _calls.items()), 'folded': dict(_folded)}
+
+def mergeReports(reports):
+  merged = {'calls': {}, 'folded': {}}
+  for report in reports:
+    for key, stats in report['calls'].items():
+      total = merged['calls'].setdefault(key, {'count': 0, 'seconds': 0.0, 'self_seconds': 0.0, 'allocated_bytes': 0})
+      for field in total:
+        total[field] += stats[field]
+    for path, seconds in report['folded'].items():
+      merged['folded'][path] = merged['folded'].get(path, 0.0) + seconds
+  return merged
+
+def writeReport(path, report):
+  with open(path, 'w') as file:
+    json.dump(report, file, indent=2, sort_keys=True)
+
+def writeFoldedStacks(path, report):
+  # One "frame;frame;frame microseconds" line per distinct call path.
+  with open(path, 'w') as file:
+    for stack, seconds in sorted(report['folded'].items()):
+      file.write('{} {}\n'.format(stack, int(round(seconds * 1e6))))
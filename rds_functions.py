@@ -1,9 +1,59 @@
-from troposphere.rds import DBSubnetGroup, DBInstance
+from troposphere.rds import DBSubnetGroup, DBInstance as RDSDBInstance
+from troposphere.applicationautoscaling import ScalableTarget, ScalingPolicy, TargetTrackingScalingPolicyConfiguration, PredefinedMetricSpecification
+from troposphere.validators import integer
 from troposphere import Parameter, Ref, Tags, Template, Output, Export, Sub
+from export_registry import RDS_SUBNET_GROUP
+
+if 'PromotionTier' in RDSDBInstance.props:
+  DBInstance = RDSDBInstance
+else:
+  # Older troposphere releases, the pinned 2.3.4 among them, do not know PromotionTier.
+  class DBInstance(RDSDBInstance):
+    props = dict(RDSDBInstance.props, PromotionTier=(integer, False))
 
 def createRDSSubnetGroup(template, subnet_resources):
   subnets = [Ref(x) for x in subnet_resources]
-  subnet_group_resource_name = "RDSSubnetGroup"
+  subnet_group_resource_name = RDS_SUBNET_GROUP.name
   subnet_group_resource = template.add_resource(DBSubnetGroup(subnet_group_resource_name, SubnetIds=subnets, DBSubnetGroupDescription="RDS subnet group."))
-  subnet_group_output = template.add_output(Output(subnet_group_resource_name, Value=Ref(subnet_group_resource_name), Export=Export(Sub("${AWS::StackName}-" + subnet_group_resource_name))))
+  subnet_group_output = template.add_output(RDS_SUBNET_GROUP.output(Ref(subnet_group_resource)))
   return subnet_group_resource, subnet_group_output
+
+# Application Auto Scaling adds and removes Aurora Replicas to keep the average of the metric over
+# the cluster's readers at the target. Replicas it adds are not part of the template.
+READER_SCALING_METRICS = {
+  'cpu': ('RDSReaderAverageCPUUtilization', 60),
+  'connections': ('RDSReaderAverageDatabaseConnections', 500),
+}
+RDS_AUTOSCALING_ROLE = "arn:${AWS::Partition}:iam::${AWS::AccountId}:role/aws-service-role/rds.application-autoscaling.amazonaws.com/AWSServiceRoleForApplicationAutoScaling_RDSCluster"
+
+def createAuroraReaderScaling(template, cluster_resource, min_capacity, max_capacity, metric, target_value, replica_resources=()):
+  # metric is a READER_SCALING_METRICS key. Scaling starts once the replicas of the template exist.
+  if metric not in READER_SCALING_METRICS:
+    raise ValueError("Unknown reader scaling metric {}, expected one of {}".format(metric, ", ".join(sorted(READER_SCALING_METRICS))))
+  scalable_target = ScalableTarget(
+    cluster_resource.title + "ReaderScalableTarget",
+    ServiceNamespace="rds",
+    ScalableDimension="rds:cluster:ReadReplicaCount",
+    ResourceId=Sub("cluster:${" + cluster_resource.title + "}"),
+    MinCapacity=min_capacity,
+    MaxCapacity=max_capacity,
+    RoleARN=Sub(RDS_AUTOSCALING_ROLE)
+  )
+  if replica_resources:
+    scalable_target.DependsOn = [resource.title for resource in replica_resources]
+  scalable_target_resource = template.add_resource(scalable_target)
+  scaling_policy_resource = template.add_resource(
+    ScalingPolicy(
+      cluster_resource.title + "ReaderScalingPolicy",
+      PolicyName=Sub("${AWS::StackName}-" + cluster_resource.title + "-readers"),
+      PolicyType="TargetTrackingScaling",
+      ScalingTargetId=Ref(scalable_target_resource),
+      TargetTrackingScalingPolicyConfiguration=TargetTrackingScalingPolicyConfiguration(
+        PredefinedMetricSpecification=PredefinedMetricSpecification(PredefinedMetricType=READER_SCALING_METRICS[metric][0]),
+        TargetValue=target_value,
+        ScaleInCooldown=300,
+        ScaleOutCooldown=300
+      )
+    )
+  )
+  return scalable_target_resource, scaling_policy_resource
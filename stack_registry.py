@@ -0,0 +1,50 @@
+import glob
+import importlib
+import os
+
+# Catalog of stack factories. Stack modules register a function that builds and returns their
+# Template; importing a stack module does not import troposphere or build anything. inputs are the
+# data files, relative to the stack modules, that the factory reads besides its source.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STACKS = {}
+
+class StackDefinition(object):
+
+  def __init__(self, name, factory, output, inputs=()):
+    self.name = name
+    self.factory = factory
+    self.output = output
+    self.inputs = tuple(inputs)
+    self.module = factory.__module__
+
+def registerStack(name, output, inputs=()):
+  def decorator(factory):
+    STACKS[name] = StackDefinition(name, factory, output, inputs)
+    return factory
+  return decorator
+
+def discoverStackModules(root=ROOT):
+  modules = []
+  for path in sorted(glob.glob(os.path.join(root, '*.py'))):
+    module = os.path.splitext(os.path.basename(path))[0]
+    if module == 'stack_registry':
+      continue
+    with open(path) as file:
+      if '@registerStack(' in file.read():
+        modules.append(module)
+  return modules
+
+def loadStacks(modules=None):
+  for module in modules if modules is not None else discoverStackModules():
+    importlib.import_module(module)
+  return STACKS
+
+def writeStack(name, output_dir='.'):
+  # Returns the paths written: the stack template, plus its nested stack templates when it had to be
+  # sharded to stay within the CloudFormation limits.
+  from template_sharding import unlimitedTemplates, writeShardedTemplate
+  definition = STACKS[name]
+  with unlimitedTemplates():
+    template = definition.factory()
+  return writeShardedTemplate(template, os.path.join(output_dir, definition.output))
@@ -0,0 +1,115 @@
+import re
+
+# Reference extraction and rewriting for rendered template dicts (Template.to_dict() or a loaded
+# template file): which parameters and resources every resource points at through Ref,
+# Fn::GetAtt, Fn::Sub and DependsOn.
+
+SUB_VARIABLE = re.compile(r'\$\{([^!}][^}]*)\}')
+
+def templateData(template):
+  return template.to_dict() if hasattr(template, 'to_dict') else template
+
+def loadTemplateFile(path):
+  import cfn_flip
+  with open(path) as file:
+    return cfn_flip.load(file.read())[0]
+
+def splitGetAtt(argument):
+  if isinstance(argument, str):
+    return argument.split('.', 1)
+  return argument
+
+def subVariables(text):
+  # (name, attribute or None) for every ${Name} / ${Name.Attribute} in a Fn::Sub string.
+  for match in SUB_VARIABLE.finditer(text):
+    name, _, attribute = match.group(1).partition('.')
+    yield name, attribute or None
+
+def findReferences(value, local_names=()):
+  # Yields (name, attribute or None) for every Ref, Fn::GetAtt and Fn::Sub variable in value.
+  if isinstance(value, dict):
+    if len(value) == 1:
+      key, argument = next(iter(value.items()))
+      if key == 'Ref' and isinstance(argument, str):
+        if argument not in local_names:
+          yield argument, None
+        return
+      if key == 'Fn::GetAtt':
+        parts = splitGetAtt(argument)
+        if isinstance(parts, list) and len(parts) == 2 and isinstance(parts[0], str):
+          yield parts[0], parts[1]
+          return
+      if key == 'Fn::Sub':
+        text, variables = (argument, {}) if isinstance(argument, str) else (argument[0], argument[1])
+        for name, attribute in subVariables(text):
+          if name not in variables and name not in local_names:
+            yield name, attribute
+        for item in variables.values():
+          for reference in findReferences(item, local_names):
+            yield reference
+        return
+    for item in value.values():
+      for reference in findReferences(item, local_names):
+        yield reference
+  elif isinstance(value, list):
+    for item in value:
+      for reference in findReferences(item, local_names):
+        yield reference
+
+def dependsOn(resource):
+  depends_on = resource.get('DependsOn', [])
+  return [depends_on] if isinstance(depends_on, str) else list(depends_on)
+
+def resourceReferences(template_data):
+  # {resource: set of resources it refers to through Ref, Fn::GetAtt or Fn::Sub}.
+  resources = template_data.get('Resources', {})
+  references = {}
+  for name, resource in resources.items():
+    targets = set(target for target, _ in findReferences(dict((key, value) for key, value in resource.items() if key != 'DependsOn')))
+    references[name] = set(target for target in targets if target in resources and target != name)
+  return references
+
+def resourceDependencies(template_data):
+  # {resource: set of resources it must wait for}, from references and DependsOn.
+  resources = template_data.get('Resources', {})
+  dependencies = resourceReferences(template_data)
+  for name, resource in resources.items():
+    dependencies[name].update(target for target in dependsOn(resource) if target in resources and target != name)
+  return dependencies
+
+def rewriteReferences(value, rewrite):
+  # Returns a copy of value where rewrite(name, attribute) replaces references. rewrite returns
+  # None to keep a reference, or the replacement as (name, attribute or None), which is emitted as
+  # a Ref (attribute None) or Fn::GetAtt, and substituted into Fn::Sub strings.
+  if isinstance(value, dict):
+    if len(value) == 1:
+      key, argument = next(iter(value.items()))
+      if key == 'Ref' and isinstance(argument, str):
+        replacement = rewrite(argument, None)
+        return value if replacement is None else referenceValue(*replacement)
+      if key == 'Fn::GetAtt':
+        parts = splitGetAtt(argument)
+        if isinstance(parts, list) and len(parts) == 2 and isinstance(parts[0], str):
+          replacement = rewrite(parts[0], parts[1])
+          return value if replacement is None else referenceValue(*replacement)
+      if key == 'Fn::Sub':
+        text, variables = (argument, {}) if isinstance(argument, str) else (argument[0], argument[1])
+        def substitute(match):
+          name, _, attribute = match.group(1).partition('.')
+          replacement = None if name in variables else rewrite(name, attribute or None)
+          if replacement is None:
+            return match.group(0)
+          return '${' + replacement[0] + ('.' + replacement[1] if replacement[1] else '') + '}'
+        text = SUB_VARIABLE.sub(substitute, text)
+        if isinstance(argument, str):
+          return {'Fn::Sub': text}
+        return {'Fn::Sub': [text, dict((name, rewriteReferences(item, rewrite)) for name, item in variables.items())]}
+    return dict((key, rewriteReferences(item, rewrite)) for key, item in value.items())
+  if isinstance(value, list):
+    return [rewriteReferences(item, rewrite) for item in value]
+  return value
+
+def referenceValue(name, attribute=None):
+  if attribute is None:
+    return {'Ref': name}
+  return {'Fn::GetAtt': [name, attribute]}
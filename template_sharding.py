@@ -0,0 +1,325 @@
+import contextlib
+import io
+import math
+import os
+import re
+import sys
+from template_graph import templateData, loadTemplateFile, findReferences, resourceDependencies, rewriteReferences, dependsOn
+from template_writer import dumpTemplate, formatForPath
+
+# Splits a rendered template that is over the CloudFormation limits into a parent template plus
+# AWS::CloudFormation::Stack children. Resources are grouped by shard key, by default the AZ index
+# in their logical ID (PrivateNet02, PrivateNet02RouteTable, ... go to AZ02), and everything
+# without a key stays in the parent. A shard gets the parent parameters and resources it refers to
+# as Parameters, and exposes what the parent or other shards use as Outputs read with
+# Fn::GetAtt <Shard>Stack.Outputs.<Name>. Every parameter stays on the parent and is passed down,
+# so a sharded stack takes the same parameters as before. Shards that do not refer to each other
+# have no dependency between them, so CloudFormation creates them in parallel.
+
+TEMPLATE_LIMITS = {'resources': 500, 'parameters': 200, 'outputs': 200, 'bytes': 1000000}
+TEMPLATE_URL_PARAMETER = 'NestedTemplateBaseURL'
+PARENT_STACK_NAME_PARAMETER = 'ParentStackName'
+AZ_INDEX = re.compile(r'(\d+)(?=\D*$)')
+# troposphere refuses to add more than its own limit of resources, parameters and outputs to a
+# Template (200, 60 and 60 before 3.0), which stops a stack factory before the sharder sees it.
+TROPOSPHERE_LIMITS = ('MAX_RESOURCES', 'MAX_PARAMETERS', 'MAX_OUTPUTS')
+
+@contextlib.contextmanager
+def unlimitedTemplates():
+  # Lifts troposphere's template limits while a stack factory runs; the rendered template is
+  # checked against TEMPLATE_LIMITS and sharded instead.
+  import troposphere
+  saved = dict((name, getattr(troposphere, name)) for name in TROPOSPHERE_LIMITS if hasattr(troposphere, name))
+  for name in saved:
+    setattr(troposphere, name, sys.maxsize)
+  try:
+    yield
+  finally:
+    for name, value in saved.items():
+      setattr(troposphere, name, value)
+
+def azShardKey(logical_id):
+  match = AZ_INDEX.search(logical_id)
+  return 'AZ' + match.group(1) if match else None
+
+def templateSize(template_data, format='yaml'):
+  output = io.StringIO()
+  dumpTemplate(template_data, output, format)
+  return len(output.getvalue().encode('utf-8'))
+
+def limitViolations(template_data, limits=TEMPLATE_LIMITS, format='yaml', size=None):
+  counts = {
+    'resources': len(template_data.get('Resources', {})),
+    'parameters': len(template_data.get('Parameters', {})),
+    'outputs': len(template_data.get('Outputs', {})),
+  }
+  violations = ['{} {} (limit {})'.format(counts[name], name, limits[name]) for name in ('resources', 'parameters', 'outputs') if counts[name] > limits[name]]
+  if not violations:
+    size = templateSize(template_data, format) if size is None else size
+    if size > limits['bytes']:
+      violations.append('{} bytes (limit {})'.format(size, limits['bytes']))
+  return violations
+
+def _usesKey(value, keys):
+  if isinstance(value, dict):
+    return any(key in keys for key in value) or any(_usesKey(item, keys) for item in value.values())
+  if isinstance(value, list):
+    return any(_usesKey(item, keys) for item in value)
+  return False
+
+def _topologicalOrder(names, dependencies):
+  # Resources in template order, each after the resources of names it depends on.
+  members = set(names)
+  ordered = []
+  done = set()
+  def visit(name, path):
+    if name in done:
+      return
+    if name in path:
+      raise ValueError('Circular dependency between ' + ', '.join(sorted(path)))
+    path.add(name)
+    for dependency in sorted(dependencies[name] & members):
+      visit(dependency, path)
+    path.discard(name)
+    done.add(name)
+    ordered.append(name)
+  for name in names:
+    visit(name, set())
+  return ordered
+
+class Shard(object):
+
+  def __init__(self, name, resources):
+    self.name = name
+    self.stack_name = name + 'Stack'
+    self.resources = resources
+    self.parameters = dict()
+    self.outputs = dict()
+    self.stack_parameters = dict()
+    self.depends_on = []
+    self.data = None
+
+class TemplateSharder(object):
+
+  def __init__(self, template_data, base_name, shard_key=azShardKey, format='yaml'):
+    self.source = template_data
+    self.base_name = base_name
+    self.shard_key = shard_key
+    self.format = format
+    self.dependencies = resourceDependencies(template_data)
+    self.owner = {}
+    self.shards = dict()
+
+  def fileName(self, shard):
+    return '{}-{}.{}'.format(self.base_name, shard.name, 'json' if self.format == 'json' else 'yaml')
+
+  def group(self, limits):
+    groups = dict()
+    for name in self.source.get('Resources', {}):
+      key = self.shard_key(name)
+      if key is not None:
+        groups.setdefault(key, []).append(name)
+    for key, names in groups.items():
+      self.split(key, _topologicalOrder(names, self.dependencies), limits)
+
+  def split(self, key, names, limits):
+    # Chunks a group along its topological order until every chunk is within the limits, so later
+    # chunks only depend on earlier ones.
+    count = int(math.ceil(len(names) / float(limits['resources'])))
+    while True:
+      size = int(math.ceil(len(names) / float(count)))
+      chunks = [names[index:index + size] for index in range(0, len(names), size)]
+      shards = [Shard(key if len(chunks) == 1 else '{}Part{}'.format(key, index + 1), chunk) for index, chunk in enumerate(chunks)]
+      for shard in shards:
+        self.shards[shard.name] = shard
+        for name in shard.resources:
+          self.owner[name] = shard
+      if all(not limitViolations(self.render(shard), limits, self.format) for shard in shards) or size == 1:
+        return
+      for shard in shards:
+        del self.shards[shard.name]
+      count += 1
+
+  def exportFrom(self, owner, name, attribute):
+    # The value a stack outside owner uses for owner's name(.attribute): the resource itself for
+    # the parent, a nested stack output otherwise.
+    if owner is None:
+      return {'Ref': name} if attribute is None else {'Fn::GetAtt': [name, attribute]}
+    output_name = self.parameterName(name, attribute)
+    owner.outputs[output_name] = {'Value': {'Ref': name} if attribute is None else {'Fn::GetAtt': [name, attribute]}}
+    return {'Fn::GetAtt': [owner.stack_name, 'Outputs.' + output_name]}
+
+  def parameterName(self, name, attribute):
+    return name if attribute is None else name + re.sub(r'[^A-Za-z0-9]', '', attribute)
+
+  def render(self, shard):
+    source_parameters = self.source.get('Parameters', {})
+    resources = self.source['Resources']
+    shard.parameters = dict()
+    shard.stack_parameters = dict()
+    shard.depends_on = []
+    def rewrite(name, attribute):
+      if name == 'AWS::StackName':
+        name = PARENT_STACK_NAME_PARAMETER
+        value = {'Ref': 'AWS::StackName'}
+      elif name.startswith('AWS::'):
+        return None
+      elif name in source_parameters:
+        shard.parameters[name] = source_parameters[name]
+        shard.stack_parameters[name] = {'Ref': name}
+        return None
+      elif name in resources and self.owner.get(name) is not shard:
+        value = self.exportFrom(self.owner.get(name), name, attribute)
+        name = self.parameterName(name, attribute)
+      else:
+        return None
+      shard.parameters.setdefault(name, {'Type': 'String'})
+      shard.stack_parameters[name] = value
+      return name, None
+    shard_resources = dict()
+    for name in shard.resources:
+      resource = dict(resources[name])
+      external = [target for target in dependsOn(resource) if self.owner.get(target) is not shard]
+      for target in external:
+        owner = self.owner.get(target)
+        stack = target if owner is None else owner.stack_name
+        if stack not in shard.depends_on:
+          shard.depends_on.append(stack)
+      if 'DependsOn' in resource:
+        local = [target for target in dependsOn(resource) if target not in external]
+        if local:
+          resource['DependsOn'] = local
+        else:
+          del resource['DependsOn']
+      shard_resources[name] = rewriteReferences(resource, rewrite)
+    data = dict([('AWSTemplateFormatVersion', '2010-09-09')])
+    data['Description'] = '{} resources of {}'.format(shard.name, self.base_name)
+    conditions = self.source.get('Conditions')
+    if conditions and _usesKey(list(shard_resources.values()), ('Condition', 'Fn::If')):
+      for name, _ in findReferences(conditions):
+        if name in source_parameters:
+          shard.parameters[name] = source_parameters[name]
+          shard.stack_parameters[name] = {'Ref': name}
+      data['Conditions'] = conditions
+    if self.source.get('Mappings') and _usesKey(list(shard_resources.values()), ('Fn::FindInMap',)):
+      data['Mappings'] = self.source['Mappings']
+    if shard.parameters:
+      data['Parameters'] = shard.parameters
+    data['Resources'] = shard_resources
+    shard.data = data
+    return data
+
+  def parent(self):
+    source_parameters = self.source.get('Parameters', {})
+    resources = self.source['Resources']
+    def rewrite(name, attribute):
+      owner = self.owner.get(name)
+      if owner is None:
+        return None
+      reference = self.exportFrom(owner, name, attribute)['Fn::GetAtt']
+      return reference[0], reference[1]
+    def stackDependencies(resource):
+      stacks = []
+      for target in dependsOn(resource):
+        owner = self.owner.get(target)
+        stack = target if owner is None else owner.stack_name
+        if stack not in stacks:
+          stacks.append(stack)
+      return stacks
+    data = dict()
+    for key, value in self.source.items():
+      if key not in ('Parameters', 'Resources', 'Outputs'):
+        data[key] = value
+    parent_resources = dict()
+    for name, resource in resources.items():
+      if name in self.owner:
+        continue
+      resource = rewriteReferences(resource, rewrite)
+      if 'DependsOn' in resource:
+        resource = dict(resource, DependsOn=stackDependencies(resource))
+      parent_resources[name] = resource
+    data['Parameters'] = dict(source_parameters)
+    data['Parameters'][TEMPLATE_URL_PARAMETER] = {'Type': 'String', 'Description': 'URL prefix the nested stack templates of this stack are uploaded to.'}
+    for shard in self.shards.values():
+      stack = dict([('Type', 'AWS::CloudFormation::Stack')])
+      if shard.depends_on:
+        stack['DependsOn'] = shard.depends_on
+      stack['Properties'] = dict([
+        ('TemplateURL', {'Fn::Sub': '${' + TEMPLATE_URL_PARAMETER + '}/' + self.fileName(shard)}),
+        ('Parameters', shard.stack_parameters),
+      ])
+      parent_resources[shard.stack_name] = stack
+    data['Resources'] = parent_resources
+    if 'Outputs' in self.source:
+      data['Outputs'] = rewriteReferences(self.source['Outputs'], rewrite)
+    return data
+
+  def checkStackCycles(self):
+    # Raises ValueError when the parent resources and nested stacks would depend on each other.
+    def node(name):
+      owner = self.owner.get(name)
+      return name if owner is None else owner.stack_name
+    edges = {}
+    for name, targets in self.dependencies.items():
+      edges.setdefault(node(name), set()).update(node(target) for target in targets)
+    for name, targets in edges.items():
+      targets.discard(name)
+    _topologicalOrder(list(edges), edges)
+
+def shardTemplate(template, base_name, shard_key=azShardKey, limits=TEMPLATE_LIMITS, format='yaml'):
+  # Returns (parent template dict, [(file name, shard template dict)]). Raises ValueError when the
+  # resources cannot be partitioned within the limits.
+  sharder = TemplateSharder(templateData(template), base_name, shard_key, format)
+  sharder.group(limits)
+  for shard in sharder.shards.values():
+    shard.outputs.clear()
+  for shard in sharder.shards.values():
+    sharder.render(shard)
+  parent = sharder.parent()
+  sharder.checkStackCycles()
+  shards = []
+  for shard in sharder.shards.values():
+    if shard.outputs:
+      shard.data['Outputs'] = shard.outputs
+    violations = limitViolations(shard.data, limits, format)
+    if violations:
+      raise ValueError('Shard {} of {} exceeds the template limits: {}'.format(shard.name, base_name, ', '.join(violations)))
+    shards.append((sharder.fileName(shard), shard.data))
+  violations = limitViolations(parent, limits, format)
+  if violations:
+    raise ValueError('Parent template of {} exceeds the template limits: {}'.format(base_name, ', '.join(violations)))
+  return parent, shards
+
+def writeShardedTemplate(template, path, shard_key=azShardKey, limits=TEMPLATE_LIMITS):
+  # Writes template to path, split into path plus one file per shard next to it when it is over
+  # the limits. Returns the paths written.
+  format = formatForPath(path)
+  template_data = templateData(template)
+  output = io.StringIO()
+  dumpTemplate(template_data, output, format)
+  body = output.getvalue()
+  shards = []
+  if limitViolations(template_data, limits, format, len(body.encode('utf-8'))):
+    parent, shards = shardTemplate(template_data, os.path.splitext(os.path.basename(path))[0], shard_key, limits, format)
+    output = io.StringIO()
+    dumpTemplate(parent, output, format)
+    body = output.getvalue()
+  with open(path, 'w') as file:
+    file.write(body)
+  paths = [path]
+  for file_name, shard_data in shards:
+    shard_path = os.path.join(os.path.dirname(path), file_name)
+    with open(shard_path, 'w') as file:
+      dumpTemplate(shard_data, file, format)
+    paths.append(shard_path)
+  return paths
+
+def main(paths):
+  for path in paths:
+    base_name, extension = os.path.splitext(path)
+    written = writeShardedTemplate(loadTemplateFile(path), base_name + '-sharded' + extension)
+    print('{}: {}'.format(path, ', '.join(written)))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import re
+import sys
+from cidr_allocator import ipToInt, parseCidr, formatCidr
+from template_graph import templateData, loadTemplateFile, findReferences, dependsOn
+
+# Checks the mistakes in generated templates that otherwise surface as failed deploys: references
+# to missing parameters, resources or conditions, parameter defaults that violate their own
+# constraints, and CIDR blocks that are not network addresses. Parameters and resources are
+# validated separately and their findings cached by a hash of their definition plus whatever else
+# the check depends on, so after a change only the parameters and resources it touched are checked
+# again. The cache is tied to a hash of the checks' source, so changing a check starts it over.
+# This is a fast subset of cfn-lint for the build, not a replacement for a full lint run.
+
+PSEUDO_PARAMETERS = set([
+  'AWS::AccountId', 'AWS::NotificationARNs', 'AWS::NoValue', 'AWS::Partition', 'AWS::Region',
+  'AWS::StackId', 'AWS::StackName', 'AWS::URLSuffix',
+])
+CIDR_PROPERTIES = ('CidrBlock', 'CidrIp', 'DestinationCidrBlock')
+# Modules whose source decides the findings.
+RULE_MODULES = ('template_validator', 'template_graph', 'cidr_allocator')
+
+def _number(value):
+  try:
+    return float(value)
+  except (TypeError, ValueError):
+    return None
+
+def validateParameter(name, parameter):
+  # Findings for the constraints of one parameter checked against each other and its Default.
+  findings = []
+  parameter_type = parameter.get('Type')
+  default = parameter.get('Default')
+  text = None if default is None else str(default)
+  if parameter_type == 'Number':
+    for key in ('MinValue', 'MaxValue') + (('Default',) if default is not None else ()):
+      if _number(parameter.get(key, 0)) is None:
+        findings.append('{} {!r} is not a number'.format(key, parameter[key]))
+  else:
+    for key in ('MinValue', 'MaxValue'):
+      if key in parameter:
+        findings.append('{} only applies to Number parameters, {} is a {}'.format(key, name, parameter_type))
+  minimum, maximum = _number(parameter.get('MinValue')), _number(parameter.get('MaxValue'))
+  if minimum is not None and maximum is not None and minimum > maximum:
+    findings.append('MinValue {} is greater than MaxValue {}'.format(parameter['MinValue'], parameter['MaxValue']))
+  if text is None:
+    return findings
+  if text != text.strip():
+    findings.append('Default {!r} has leading or trailing whitespace'.format(text))
+  if 'AllowedValues' in parameter and text not in [str(value) for value in parameter['AllowedValues']]:
+    findings.append('Default {!r} is not one of the AllowedValues'.format(text))
+  if parameter_type == 'Number' and _number(text) is not None:
+    if minimum is not None and _number(text) < minimum:
+      findings.append('Default {} is less than MinValue {}'.format(text, parameter['MinValue']))
+    if maximum is not None and _number(text) > maximum:
+      findings.append('Default {} is greater than MaxValue {}'.format(text, parameter['MaxValue']))
+  if 'AllowedPattern' in parameter and not re.match('(?:' + parameter['AllowedPattern'] + r')\Z', text):
+    findings.append('Default {!r} does not match AllowedPattern {}'.format(text, parameter['AllowedPattern']))
+  if 'MinLength' in parameter and len(text) < int(parameter['MinLength']):
+    findings.append('Default {!r} is shorter than MinLength {}'.format(text, parameter['MinLength']))
+  if 'MaxLength' in parameter and len(text) > int(parameter['MaxLength']):
+    findings.append('Default {!r} is longer than MaxLength {}'.format(text, parameter['MaxLength']))
+  return findings
+
+def cidrFinding(value):
+  address, slash, _ = value.partition('/')
+  try:
+    if not slash:
+      raise ValueError('no prefix length')
+    network, prefixlen = parseCidr(value)
+    if ipToInt(address) != network:
+      return '{!r} is not a network address, the block is {}'.format(value, formatCidr(network, prefixlen))
+  except ValueError as error:
+    return '{!r} is not a CIDR block: {}'.format(value, error)
+  return None
+
+def _cidrValues(value, parameters):
+  # (where, CIDR string) for the CidrBlock-like properties in value, through Refs to parameter defaults.
+  if isinstance(value, dict):
+    for key, item in value.items():
+      if key in CIDR_PROPERTIES:
+        if isinstance(item, str):
+          yield key, item
+        elif isinstance(item, dict) and isinstance(item.get('Ref'), str) and 'Default' in parameters.get(item['Ref'], {}):
+          yield '{} (Default of {})'.format(key, item['Ref']), str(parameters[item['Ref']]['Default'])
+      else:
+        for found in _cidrValues(item, parameters):
+          yield found
+  elif isinstance(value, list):
+    for item in value:
+      for found in _cidrValues(item, parameters):
+        yield found
+
+def _conditionNames(value):
+  if isinstance(value, dict):
+    for key, item in value.items():
+      if key == 'Fn::If' and isinstance(item, list) and item and isinstance(item[0], str):
+        yield item[0]
+      elif key == 'Condition' and isinstance(item, str):
+        yield item
+      for name in _conditionNames(item):
+        yield name
+  elif isinstance(value, list):
+    for item in value:
+      for name in _conditionNames(item):
+        yield name
+
+def validateResource(name, resource, parameters, resources, conditions):
+  findings = []
+  for target, attribute in findReferences(resource.get('Properties', {})):
+    if attribute is None and target not in parameters and target not in resources and target not in PSEUDO_PARAMETERS:
+      findings.append('refers to {}, which is not a parameter or resource'.format(target))
+    elif attribute is not None and target not in resources:
+      findings.append('gets attribute {} of {}, which is not a resource'.format(attribute, target))
+  for target in dependsOn(resource):
+    if target not in resources:
+      findings.append('depends on {}, which is not a resource'.format(target))
+  for condition in _conditionNames(resource):
+    if condition not in conditions:
+      findings.append('uses condition {}, which is not defined'.format(condition))
+  for where, cidr in _cidrValues(resource.get('Properties', {}), parameters):
+    finding = cidrFinding(cidr)
+    if finding:
+      findings.append('{}: {}'.format(where, finding))
+  return findings
+
+def _digest(*values):
+  return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+def rulesDigest():
+  digest = hashlib.sha256()
+  root = os.path.dirname(os.path.abspath(__file__))
+  for module in RULE_MODULES:
+    with open(os.path.join(root, module + '.py'), 'rb') as file:
+      digest.update(file.read())
+  return digest.hexdigest()
+
+class TemplateValidator(object):
+
+  def __init__(self, cache_path=None):
+    self.cache_path = cache_path
+    self.rules = rulesDigest()
+    self.cache = {}
+    self.used = set()
+    self.hits = 0
+    self.misses = 0
+    if cache_path and os.path.exists(cache_path):
+      self.cache = self.load()
+
+  def load(self):
+    # The findings cached for the current checks; a cache written by other checks is dropped.
+    with open(self.cache_path) as file:
+      data = json.load(file)
+    return data.get('findings', {}) if data.get('rules') == self.rules else {}
+
+  def cached(self, key, check):
+    self.used.add(key)
+    if key in self.cache:
+      self.hits += 1
+    else:
+      self.misses += 1
+      self.cache[key] = check()
+    return self.cache[key]
+
+  def validate(self, template):
+    # [(location, message)] for a troposphere Template or template dict.
+    template_data = templateData(template)
+    parameters = template_data.get('Parameters', {})
+    resources = template_data.get('Resources', {})
+    conditions = template_data.get('Conditions', {})
+    findings = []
+    for name, parameter in parameters.items():
+      key = _digest('parameter', name, parameter)
+      findings.extend(('Parameters.' + name, message) for message in self.cached(key, lambda: validateParameter(name, parameter)))
+    for name, resource in resources.items():
+      # A resource's findings depend on which of the names it uses exist, and on the defaults of
+      # the parameters it takes CIDR blocks from.
+      used = set(target for target, _ in findReferences(resource)) | set(dependsOn(resource)) | set(_conditionNames(resource))
+      context = sorted((target, target in parameters, target in resources, target in conditions, parameters.get(target, {}).get('Default') if target in parameters else None) for target in used)
+      key = _digest('resource', name, resource, context)
+      findings.extend(('Resources.' + name, message) for message in self.cached(key, lambda: validateResource(name, resource, parameters, resources, conditions)))
+    for name, output in template_data.get('Outputs', {}).items():
+      for target, attribute in findReferences(output.get('Value')):
+        if target not in resources and target not in parameters and target not in PSEUDO_PARAMETERS:
+          findings.append(('Outputs.' + name, 'refers to {}, which is not a parameter or resource'.format(target)))
+    return findings
+
+  def save(self):
+    # Merges the findings of this run into the cache file, so validating a subset of the stacks
+    # keeps the entries of the others.
+    if self.cache_path:
+      directory = os.path.dirname(self.cache_path)
+      if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+      findings = self.load() if os.path.exists(self.cache_path) else {}
+      findings.update((key, self.cache[key]) for key in self.used)
+      with open(self.cache_path, 'w') as file:
+        json.dump({'rules': self.rules, 'findings': findings}, file)
+
+def main(paths):
+  validator = TemplateValidator()
+  count = 0
+  for path in paths:
+    for location, message in validator.validate(loadTemplateFile(path)):
+      print('{}: {}: {}'.format(path, location, message))
+      count += 1
+  print('{} templates validated, {} findings'.format(len(paths), count))
+  return 1 if count else 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,62 @@
+import json
+import yaml
+
+# Streams a template dict straight to a file as short form CloudFormation YAML (!Ref, !Sub,
+# !GetAtt, ...) or compact JSON, instead of Template.to_yaml()'s JSON -> cfn-flip round trip.
+# The libyaml emitter is used when PyYAML was built with it.
+
+try:
+  from yaml import CSafeDumper as BaseDumper
+except ImportError:
+  from yaml import SafeDumper as BaseDumper
+
+class CloudFormationDumper(BaseDumper):
+  pass
+
+class ShortForm(object):
+  __slots__ = ('tag', 'value')
+
+  def __init__(self, tag, value):
+    self.tag = tag
+    self.value = value
+
+def representShortForm(dumper, data):
+  if isinstance(data.value, list):
+    return dumper.represent_sequence(data.tag, data.value)
+  if isinstance(data.value, dict):
+    return dumper.represent_mapping(data.tag, data.value)
+  return dumper.represent_scalar(data.tag, str(data.value), style="'" if data.value == '' else None)
+
+CloudFormationDumper.add_representer(ShortForm, representShortForm)
+
+def shortForm(value):
+  if isinstance(value, dict):
+    if len(value) == 1:
+      key, argument = next(iter(value.items()))
+      if key == 'Ref':
+        return ShortForm('!Ref', argument)
+      if key == 'Fn::GetAtt' and isinstance(argument, list) and all(isinstance(part, str) for part in argument):
+        return ShortForm('!GetAtt', '.'.join(argument))
+      if key.startswith('Fn::'):
+        argument = shortForm(argument)
+        if isinstance(argument, ShortForm):
+          # A node carries a single tag, so a nested function stays in long form.
+          inner_key, inner_argument = next(iter(value[key].items()))
+          argument = {inner_key: argument.value if inner_key != 'Fn::GetAtt' else inner_argument}
+        return ShortForm('!' + key[4:], argument)
+    return dict((key, shortForm(item)) for key, item in value.items())
+  if isinstance(value, list):
+    return [shortForm(item) for item in value]
+  return value
+
+def dumpTemplate(template_data, file, format='yaml'):
+  if format == 'json':
+    json.dump(template_data, file, separators=(',', ':'), sort_keys=True)
+  else:
+    yaml.dump(shortForm(template_data), file, Dumper=CloudFormationDumper, default_flow_style=False, allow_unicode=True)
+
+def writeTemplate(template, file, format='yaml'):
+  dumpTemplate(template.to_dict(), file, format)
+
+def formatForPath(path):
+  return 'json' if path.endswith('.json') else 'yaml'
@@ -1,47 +1,246 @@
-import math
-import netaddr
+import collections
+import functools
+import json
+import re
 from troposphere import Base64, FindInMap, GetAtt, Join, Output, Sub, Select, GetAZs
 from troposphere import Parameter, Ref, Tags, Template
 from troposphere.ec2 import Route, VPCGatewayAttachment, SubnetRouteTableAssociation, Subnet, RouteTable, VPC,  EIP, NatGateway, InternetGateway, SecurityGroup
+from troposphere.ec2 import SecurityGroupRule, VPCEndpoint
+from cidr_allocator import ADDRESS_BITS, BuddyAllocator, parseCidr, formatCidr, blockSize, nextPowerOfTwo, log2
 
 # Subnet calculation code taken from https://github.com/tomelliff/vpc-subnet-calculator/blob/master/vpc_subnet_calculator.py
+# CIDR math is done on integers by cidr_allocator instead of enumerating every subnet with netaddr.
+
+MAX_AWS_VPC_SUBNET_BIT_MASK = 28
+MIN_AWS_VPC_SUBNET_BIT_MASK = 16
+AWS_RESERVED_SUBNET_ADDRESSES = 5
+SUBNET_PLAN_CACHE_SIZE = 1024
+DEFAULT_TIER_LAYOUT = ('private', 'public')
+TIER_SUBNET_NAMES = {'private': 'PrivateNet', 'public': 'PublicNet'}
+NAT_PER_TIER_AZ = 'per-tier-az'
+NAT_PER_AZ = 'per-az'
+NAT_PER_TIER = 'per-tier'
+NAT_SINGLE = 'single'
+NAT_NONE = 'none'
+NAT_MODES = (NAT_PER_TIER_AZ, NAT_PER_AZ, NAT_PER_TIER, NAT_SINGLE, NAT_NONE)
+GATEWAY_ENDPOINT_SERVICES = ('s3', 'dynamodb')
+ENDPOINT_NAMES = {'s3': 'S3', 'dynamodb': 'DynamoDB', 'ecr.api': 'ECRApi', 'ecr.dkr': 'ECRDocker', 'sqs': 'SQS', 'sns': 'SNS', 'kms': 'KMS', 'ssm': 'SSM', 'sts': 'STS'}
 
 def getNextBinary(integer):
-  next_binary = int(math.pow(2, math.ceil(math.log(integer) / math.log(2))))
+  next_binary = nextPowerOfTwo(integer)
   if next_binary == integer:
     next_binary = getNextBinary(integer + 1)
-  return int(next_binary)
+  return next_binary
 
 def subtractSubnetsFromRange(cidr_range, subnets):
-  full_range = netaddr.IPNetwork(cidr_range)
-  subnet_mask_bits = netaddr.IPNetwork(subnets[0]).prefixlen
-  remaining_subnets = [str(subnet) for subnet in full_range.subnet(subnet_mask_bits) if str(subnet) not in subnets]
-  return str(netaddr.cidr_merge(remaining_subnets)[0])
+  allocator = BuddyAllocator(cidr_range)
+  subnet_mask_bits = parseCidr(subnets[0])[1]
+  subnet_size = blockSize(subnet_mask_bits)
+  networks = sorted(set(parseCidr(subnet)[0] for subnet in subnets))
+  run_start = 0
+  for index, network in enumerate(networks):
+    if index + 1 == len(networks) or networks[index + 1] != network + subnet_size:
+      allocator.reserveBlocks(networks[run_start], subnet_mask_bits, index + 1 - run_start)
+      run_start = index + 1
+  return allocator.firstFreeBlock()
 
-def maximizeSubnets(cidr_range, num_subnets):
-  MAX_AWS_VPC_SUBNET_BIT_MASK = 28
-  MIN_AWS_VPC_SUBNET_BIT_MASK = 16
-  full_range = netaddr.IPNetwork(cidr_range)
-  full_range_mask_bits = full_range.prefixlen
-  subnet_mask_bits = (full_range_mask_bits + int(math.log(getNextBinary(num_subnets), 2)))
+def maximizeSubnetNetworks(cidr_range, num_subnets):
+  full_range, full_range_mask_bits = parseCidr(cidr_range)
+  subnet_mask_bits = full_range_mask_bits + log2(getNextBinary(num_subnets))
   if subnet_mask_bits > MAX_AWS_VPC_SUBNET_BIT_MASK:
     raise ValueError('Minimum subnet size is /{}'.format(MAX_AWS_VPC_SUBNET_BIT_MASK))
   elif subnet_mask_bits < MIN_AWS_VPC_SUBNET_BIT_MASK:
     raise ValueError('Maximum subnet size is /{}'.format(MIN_AWS_VPC_SUBNET_BIT_MASK))
-  subnets = []
-  for subnet in full_range.subnet(subnet_mask_bits):
-    if len(subnets) < num_subnets:
-      subnets.append(str(subnet))
-  return subnets
+  return full_range, subnet_mask_bits
+
+def formatSubnets(network, subnet_mask_bits, num_subnets):
+  subnet_size = blockSize(subnet_mask_bits)
+  return [formatCidr(network + index * subnet_size, subnet_mask_bits) for index in range(num_subnets)]
+
+def maximizeSubnets(cidr_range, num_subnets):
+  network, subnet_mask_bits = maximizeSubnetNetworks(cidr_range, num_subnets)
+  return formatSubnets(network, subnet_mask_bits, num_subnets)
+
+def planSubnets(vpc_cidr_range, num_azs, tiers=DEFAULT_TIER_LAYOUT):
+  # Every tier takes num_azs subnets from the first free block left by the tiers before it.
+  # Returns {tier: (subnet per AZ)}, a new dict on every call over the cached plan.
+  return dict(_cachedSubnetPlan(vpc_cidr_range, num_azs, tuple(tiers)))
+
+@functools.lru_cache(maxsize=SUBNET_PLAN_CACHE_SIZE)
+def _cachedSubnetPlan(vpc_cidr_range, num_azs, tiers):
+  # The cached plan is shared between callers, so it is made of tuples only.
+  allocator = BuddyAllocator(vpc_cidr_range)
+  remaining_space = vpc_cidr_range
+  plan = []
+  for index, tier in enumerate(tiers):
+    network, mask_bits = maximizeSubnetNetworks(remaining_space, num_azs)
+    allocator.reserveBlocks(network, mask_bits, num_azs)
+    plan.append((tier, tuple(formatSubnets(network, mask_bits, num_azs))))
+    if index + 1 < len(tiers):
+      remaining_space = allocator.firstFreeBlock()
+  return tuple(plan)
+
+def subnetPlanCacheInfo():
+  return _cachedSubnetPlan.cache_info()
+
+def clearSubnetPlanCache():
+  _cachedSubnetPlan.cache_clear()
 
 def calculateSubnets(vpc_cidr_range, num_azs, subnet_type):
-  private_subnets = maximizeSubnets(vpc_cidr_range, num_azs)
-  remaining_space = subtractSubnetsFromRange(vpc_cidr_range, private_subnets)
-  public_subnets = maximizeSubnets(remaining_space, num_azs)
-  if subnet_type == 'private':
-    return private_subnets
-  elif subnet_type == 'public':
-    return public_subnets
+  plan = planSubnets(vpc_cidr_range, num_azs)
+  if subnet_type in plan:
+    return list(plan[subnet_type])
+
+def calculateSubnetsBatch(vpc_cidr_ranges, num_azs):
+  # Plans private and public subnets for many VPCs in one pass over integer arrays.
+  # Same results as calling calculateSubnets for every VPC and tier.
+  import numpy
+  vpc_cidr_ranges = list(vpc_cidr_ranges)
+  parsed = [parseCidr(cidr_range) for cidr_range in vpc_cidr_ranges]
+  networks = numpy.array([network for network, _ in parsed], dtype=numpy.int64)
+  prefixlens = numpy.array([prefixlen for _, prefixlen in parsed], dtype=numpy.int64)
+  counts = numpy.array(numpy.broadcast_to(numpy.asarray(num_azs, dtype=numpy.int64), networks.shape))
+  if (counts < 1).any():
+    raise ValueError('Expected a positive number of AZs for every VPC')
+  powers = numpy.left_shift(1, numpy.arange(40, dtype=numpy.int64))
+  # getNextBinary: the power of two strictly above the count, except 1 which maps to 4.
+  split_bits = numpy.searchsorted(powers, counts, side='right')
+  split_bits[counts == 1] = 2
+  private_mask_bits = prefixlens + split_bits
+  _checkSubnetMaskBits(vpc_cidr_ranges, private_mask_bits)
+  private_sizes = numpy.left_shift(1, 32 - private_mask_bits)
+  # The private run fills blocks 0..count-1, so the first free aligned block starts at block
+  # count and spans as many blocks as the lowest set bit of count.
+  remaining_networks = networks + counts * private_sizes
+  remaining_mask_bits = private_mask_bits - numpy.searchsorted(powers, counts & -counts)
+  public_mask_bits = remaining_mask_bits + split_bits
+  _checkSubnetMaskBits(vpc_cidr_ranges, public_mask_bits)
+  public_sizes = numpy.left_shift(1, 32 - public_mask_bits)
+  offsets = numpy.arange(counts.max() if len(counts) else 0, dtype=numpy.int64)
+  private_networks = networks[:, None] + offsets[None, :] * private_sizes[:, None]
+  public_networks = remaining_networks[:, None] + offsets[None, :] * public_sizes[:, None]
+  private_subnets = _formatSubnetRows(private_networks, private_mask_bits, counts)
+  public_subnets = _formatSubnetRows(public_networks, public_mask_bits, counts)
+  return private_subnets, public_subnets
+
+def _checkSubnetMaskBits(vpc_cidr_ranges, subnet_mask_bits):
+  too_small = (subnet_mask_bits > MAX_AWS_VPC_SUBNET_BIT_MASK).nonzero()[0]
+  if len(too_small):
+    raise ValueError('{}: Minimum subnet size is /{}'.format(vpc_cidr_ranges[too_small[0]], MAX_AWS_VPC_SUBNET_BIT_MASK))
+  too_large = (subnet_mask_bits < MIN_AWS_VPC_SUBNET_BIT_MASK).nonzero()[0]
+  if len(too_large):
+    raise ValueError('{}: Maximum subnet size is /{}'.format(vpc_cidr_ranges[too_large[0]], MIN_AWS_VPC_SUBNET_BIT_MASK))
+
+def _formatSubnetRows(networks, subnet_mask_bits, counts):
+  import numpy
+  valid = numpy.arange(networks.shape[1])[None, :] < counts[:, None]
+  flat = networks[valid]
+  suffixes = numpy.repeat(subnet_mask_bits, counts).tolist()
+  octets = [((flat >> shift) & 255).tolist() for shift in (24, 16, 8, 0)]
+  subnets = ['%d.%d.%d.%d/%d' % subnet for subnet in zip(octets[0], octets[1], octets[2], octets[3], suffixes)]
+  rows = []
+  start = 0
+  for count in counts.tolist():
+    rows.append(subnets[start:start + count])
+    start += count
+  return rows
+
+def subnetMaskBitsForHosts(hosts):
+  subnet_mask_bits = ADDRESS_BITS - log2(nextPowerOfTwo(hosts + AWS_RESERVED_SUBNET_ADDRESSES))
+  if subnet_mask_bits < MIN_AWS_VPC_SUBNET_BIT_MASK:
+    raise ValueError('Maximum subnet size is /{}'.format(MIN_AWS_VPC_SUBNET_BIT_MASK))
+  return min(subnet_mask_bits, MAX_AWS_VPC_SUBNET_BIT_MASK)
+
+def planTiers(vpc_cidr_range, tiers):
+  # Variable-length plan: tiers is a list of dicts with 'name', 'hosts' (usable addresses per
+  # subnet) and 'azs'. Subnets are packed largest first, each into the smallest free block that
+  # fits, so power-of-two subnets never fragment the range while there is room for them.
+  # Returns {tier name: [one CIDR per AZ]} in the order the tiers were given.
+  allocator = BuddyAllocator(vpc_cidr_range)
+  requests = []
+  for tier in tiers:
+    subnet_mask_bits = subnetMaskBitsForHosts(tier['hosts'])
+    requests.extend((subnet_mask_bits, tier['name'], az) for az in range(tier['azs']))
+  plan = dict((tier['name'], [None] * tier['azs']) for tier in tiers)
+  for subnet_mask_bits, name, az in sorted(requests, key=lambda request: request[0]):
+    plan[name][az] = allocator.allocate(subnet_mask_bits)
+  return collections.OrderedDict((tier['name'], plan[tier['name']]) for tier in tiers)
+
+def planSubnetsIncremental(vpc_cidr_range, num_azs, previous_allocation, tiers=DEFAULT_TIER_LAYOUT, reserve_azs=None):
+  # Keeps every subnet of the previous allocation of this VPC where it is and only carves subnets
+  # for new AZs out of the free space, using the mask the tier already has. Without a previous
+  # allocation for the VPC this is the planSubnets layout. reserve_azs sizes that fresh layout for
+  # that many AZs while only using num_azs of them, leaving room to grow without replacement; it
+  # does not apply when there is a previous allocation, whose subnets never move.
+  network, prefixlen = parseCidr(vpc_cidr_range)
+  previous = previous_allocation.get(formatCidr(network, prefixlen))
+  fresh_plan = planSubnets(vpc_cidr_range, num_azs if previous else max(num_azs, reserve_azs or 0), tuple(tiers))
+  if not previous:
+    return dict((tier, list(subnets[:num_azs])) for tier, subnets in fresh_plan.items())
+  allocator = BuddyAllocator(vpc_cidr_range)
+  plan = {}
+  for tier in tiers:
+    plan[tier] = list(previous.get(tier, []))[:num_azs]
+    for subnet in plan[tier]:
+      allocator.reserve(subnet)
+  subnet_mask_bits = dict((tier, parseCidr((plan[tier] or fresh_plan[tier])[0])[1]) for tier in tiers)
+  for tier in sorted(tiers, key=lambda tier: subnet_mask_bits[tier]):
+    while len(plan[tier]) < num_azs:
+      plan[tier].append(_allocateIncrementalSubnet(allocator, fresh_plan[tier], len(plan[tier]), subnet_mask_bits[tier], vpc_cidr_range, tier))
+  return plan
+
+def _allocateIncrementalSubnet(allocator, fresh_subnets, az, subnet_mask_bits, vpc_cidr_range, tier):
+  # Prefer the slot a fresh plan would use for this AZ, so reserved headroom is filled in order.
+  if az < len(fresh_subnets) and parseCidr(fresh_subnets[az])[1] == subnet_mask_bits:
+    try:
+      return allocator.reserve(fresh_subnets[az])
+    except ValueError:
+      pass
+  try:
+    return allocator.allocate(subnet_mask_bits)
+  except ValueError:
+    raise ValueError('Not enough free space in {} to add a /{} {} subnet without replacing existing subnets'.format(vpc_cidr_range, subnet_mask_bits, tier))
+
+def loadSubnetAllocation(path):
+  # Reads {vpc cidr: {tier: [subnet per AZ]}} from a JSON state file written by
+  # saveSubnetAllocation, or rebuilds it from a template previously generated with these helpers.
+  with open(path) as file:
+    content = file.read()
+  if path.endswith('.json'):
+    return json.loads(content)
+  import cfn_flip
+  return subnetAllocationFromTemplate(cfn_flip.load_yaml(content))
+
+def saveSubnetAllocation(path, allocation):
+  with open(path, "w") as file:
+    json.dump(allocation, file, indent=2, sort_keys=True)
+
+def subnetAllocationFromTemplate(template_data):
+  parameters = template_data.get('Parameters', {})
+  resources = template_data.get('Resources', {})
+  tiers = dict((subnet_name, tier) for tier, subnet_name in TIER_SUBNET_NAMES.items())
+  def cidrValue(value):
+    if isinstance(value, dict) and 'Ref' in value:
+      return parameters.get(value['Ref'], {}).get('Default')
+    return value
+  vpcs = {}
+  for name, resource in resources.items():
+    if resource.get('Type') == 'AWS::EC2::VPC':
+      vpcs[name] = cidrValue(resource.get('Properties', {}).get('CidrBlock'))
+  subnets = {}
+  for name, resource in sorted(resources.items()):
+    properties = resource.get('Properties', {})
+    match = re.match(r'^(.*?)(\d+)$', name)
+    vpc_id = properties.get('VpcId')
+    if resource.get('Type') != 'AWS::EC2::Subnet' or not match or not isinstance(vpc_id, dict) or vpc_id.get('Ref') not in vpcs:
+      continue
+    tier = tiers.get(match.group(1), match.group(1))
+    subnets.setdefault(vpcs[vpc_id['Ref']], {}).setdefault(tier, []).append((int(match.group(2)), cidrValue(properties.get('CidrBlock'))))
+  allocation = {}
+  for vpc_cidr, vpc_tiers in subnets.items():
+    network, prefixlen = parseCidr(vpc_cidr)
+    allocation[formatCidr(network, prefixlen)] = dict((tier, [cidr for _, cidr in sorted(tier_subnets)]) for tier, tier_subnets in vpc_tiers.items())
+  return allocation
 
 def createVPC(template, vpc_name, cidr_block):
   vpc_parameter = template.add_parameter(Parameter(vpc_name + "CIDR", Description="Name of VPC. Set to " + cidr_block + " by default.", Type="String", Default=cidr_block, AllowedPattern='((\d{1,3})\.){3}\d{1,3}/\d{1,2}'))
@@ -61,45 +260,144 @@ def associateRouteTable(template, association_name, route_table, subnet):
   route_association = template.add_resource(SubnetRouteTableAssociation(association_name, SubnetId=Ref(subnet), RouteTableId=Ref(route_table)))
   return route_association
 
-def createPublicNetworks(template, vpc_parameter, vpc_resource, regions_count):
+def createPublicNetworks(template, vpc_parameter, vpc_resource, regions_count, subnets=None, tier_name="PublicNet"):
   subnet_parameters = []
   subnet_resources = []
   vpc_cidr_block = vpc_parameter.properties['Default']
   internet_cidr_block = '0.0.0.0/0'
   igw_name = "PublicInternetGateway"
-  public_subnets = calculateSubnets(vpc_cidr_block, regions_count, 'public')
-  public_route_table = createRouteTable(template, 'PublicRouteTable', vpc_resource)
-  public_igw = template.add_resource(InternetGateway(igw_name, Tags=Tags(Name=Sub("${AWS::StackName}" + "-" + igw_name))))
-  public_igw_attachment = template.add_resource(VPCGatewayAttachment('PublicRouteTableAttachment', VpcId=Ref(vpc_resource), InternetGatewayId=Ref(public_igw)))
+  igw_attachment_name = "PublicRouteTableAttachment"
+  # The default tier keeps the names the single public tier of earlier templates had.
+  prefix = "Public" if tier_name == TIER_SUBNET_NAMES['public'] else tier_name
+  public_subnets = subnets if subnets is not None else calculateSubnets(vpc_cidr_block, regions_count, 'public')
+  public_route_table = createRouteTable(template, prefix + 'RouteTable', vpc_resource)
+  if igw_name in template.resources:
+    # A VPC has a single internet gateway, further public tiers route through the one already there.
+    public_igw = template.resources[igw_name]
+    public_igw_attachment = template.resources[igw_attachment_name]
+    if public_igw_attachment.VpcId.data != {'Ref': vpc_resource.title}:
+      raise ValueError('{} is attached to another VPC than {}'.format(igw_name, vpc_resource.title))
+  else:
+    public_igw = template.add_resource(InternetGateway(igw_name, Tags=Tags(Name=Sub("${AWS::StackName}" + "-" + igw_name))))
+    public_igw_attachment = template.add_resource(VPCGatewayAttachment(igw_attachment_name, VpcId=Ref(vpc_resource), InternetGatewayId=Ref(public_igw)))
   for az, subnet in enumerate(public_subnets):
-    subnet_name = "PublicNet" + str("%02d" % (az + 1))
+    subnet_name = tier_name + str("%02d" % (az + 1))
     route_table_association_name = subnet_name + "RouteAssociation"
     subnet_parameter, subnet_resource = createSubnet(template, subnet_name, vpc_resource, subnet, az)
     subnet_parameters.append(subnet_parameter)
     subnet_resources.append(subnet_resource)
     associateRouteTable(template, route_table_association_name, public_route_table, subnet_name)
-  public_igw_route = template.add_resource(Route('PublicInternetRoute', DependsOn=public_igw_attachment, GatewayId=Ref(public_igw), DestinationCidrBlock=internet_cidr_block, RouteTableId=Ref(public_route_table)))
+  public_igw_route = template.add_resource(Route(prefix + 'InternetRoute', DependsOn=public_igw_attachment, GatewayId=Ref(public_igw), DestinationCidrBlock=internet_cidr_block, RouteTableId=Ref(public_route_table)))
   return subnet_parameters, subnet_resources
 
-def createPrivateNetworks(template, vpc_parameter, vpc_resource, regions_count):
+class NatTopology(object):
+  # Which route table each private subnet uses and which NAT gateway that route table sends internet
+  # traffic to. Pass the same instance to createPrivateNetworks for every tier so they share it.
+  #   per-tier-az  a route table and NAT gateway per subnet
+  #   per-az       a route table and NAT gateway per AZ, shared by all tiers; traffic stays in its AZ
+  #   per-tier     a route table and NAT gateway per tier, in the tier's first AZ
+  #   single       one route table and NAT gateway for the whole VPC
+  #   none         a route table per tier without internet access
+  # NAT gateways go into public_subnets[az]. Only per-tier-az may leave them out and put each NAT
+  # gateway into its own private subnet, the layout of the existing stacks; the shared modes route
+  # other subnets through it, which needs a NAT gateway with a route to the internet gateway.
+
+  def __init__(self, mode=NAT_PER_TIER_AZ, public_subnets=None):
+    if mode not in NAT_MODES:
+      raise ValueError("Unknown NAT topology mode {}, expected one of {}".format(mode, ", ".join(NAT_MODES)))
+    if mode in (NAT_PER_AZ, NAT_PER_TIER, NAT_SINGLE) and not public_subnets:
+      raise ValueError("NAT topology mode {} shares NAT gateways and needs public subnets to put them in".format(mode))
+    self.mode = mode
+    self.public_subnets = public_subnets
+    self.route_tables = collections.OrderedDict()
+    self.nat_gateways = collections.OrderedDict()
+
+  def prefix(self, tier_name, az, subnet_name):
+    if self.mode == NAT_PER_TIER_AZ:
+      return subnet_name
+    if self.mode == NAT_PER_AZ:
+      return "Private" + str("%02d" % (az + 1))
+    if self.mode == NAT_SINGLE:
+      return "Private"
+    return tier_name
+
+  def routeTable(self, template, vpc_resource, tier_name, az, subnet_name):
+    prefix = self.prefix(tier_name, az, subnet_name)
+    if prefix not in self.route_tables:
+      self.route_tables[prefix] = createRouteTable(template, prefix + "RouteTable", vpc_resource)
+    return self.route_tables[prefix]
+
+  def natRoute(self, template, tier_name, az, subnet_name):
+    # Adds the NAT gateway and default route of the subnet's route table unless they exist already.
+    prefix = self.prefix(tier_name, az, subnet_name)
+    if self.mode == NAT_NONE or prefix in self.nat_gateways:
+      return
+    eip_name = prefix + "ElasticIP"
+    nat_gw_name = prefix + "NATGateway"
+    nat_subnet = self.public_subnets[az] if self.public_subnets else subnet_name
+    template.add_resource(EIP(eip_name, Domain="vpc"))
+    self.nat_gateways[prefix] = template.add_resource(NatGateway(nat_gw_name, AllocationId=GetAtt(eip_name, 'AllocationId'), SubnetId=Ref(nat_subnet)))
+    template.add_resource(Route(prefix + "NATGatewayRoute", RouteTableId=Ref(self.route_tables[prefix]), DestinationCidrBlock='0.0.0.0/0', NatGatewayId=Ref(nat_gw_name)))
+
+
+def natTopologyReport(template):
+  # Route table and NAT gateway counts of a Template or template dict, and the subnets whose
+  # internet traffic goes through a NAT gateway in another AZ.
+  resources = template.to_dict()['Resources'] if hasattr(template, 'to_dict') else template['Resources']
+  def ref(value):
+    return value.get('Ref') if isinstance(value, dict) else value
+  def subnetAz(name):
+    zone = resources.get(name, {}).get('Properties', {}).get('AvailabilityZone')
+    return zone['Fn::Select'][0] if isinstance(zone, dict) and 'Fn::Select' in zone else zone
+  nat_routes = {}
+  for resource in resources.values():
+    properties = resource.get('Properties', {})
+    if resource['Type'] == 'AWS::EC2::Route' and 'NatGatewayId' in properties:
+      nat_routes[ref(properties['RouteTableId'])] = ref(properties['NatGatewayId'])
+  cross_az = []
+  for resource in resources.values():
+    properties = resource.get('Properties', {})
+    if resource['Type'] == 'AWS::EC2::SubnetRouteTableAssociation' and ref(properties['RouteTableId']) in nat_routes:
+      subnet = ref(properties['SubnetId'])
+      nat_subnet = ref(resources[nat_routes[ref(properties['RouteTableId'])]]['Properties']['SubnetId'])
+      if str(subnetAz(subnet)) != str(subnetAz(nat_subnet)):
+        cross_az.append(subnet)
+  counts = collections.Counter(resource['Type'] for resource in resources.values())
+  return collections.OrderedDict([('route_tables', counts['AWS::EC2::RouteTable']), ('nat_gateways', counts['AWS::EC2::NatGateway']), ('cross_az_subnets', sorted(cross_az))])
+
+def createPrivateNetworks(template, vpc_parameter, vpc_resource, regions_count, subnets=None, tier_name="PrivateNet", nat_topology=None):
+  # vpc_parameter is only read to plan the subnets when none are given.
   subnet_parameters = []
   subnet_resources = []
-  vpc_cidr_block = vpc_parameter.properties['Default']
-  internet_cidr_block = '0.0.0.0/0'
-  private_subnets = calculateSubnets(vpc_cidr_block, regions_count, 'private')
+  nat_topology = nat_topology if nat_topology is not None else NatTopology()
+  private_subnets = subnets if subnets is not None else calculateSubnets(vpc_parameter.properties['Default'], regions_count, 'private')
   for az, subnet in enumerate(private_subnets):
-    subnet_name = "PrivateNet" + str("%02d" % (az + 1))
-    route_table_name = subnet_name + "RouteTable"
-    eip_name = subnet_name + "ElasticIP"
-    nat_gw_name = subnet_name + "NATGateway"
-    nat_gw_route_name = subnet_name + "NATGatewayRoute"
-    private_route_table = createRouteTable(template, route_table_name, vpc_resource)
+    subnet_name = tier_name + str("%02d" % (az + 1))
+    private_route_table = nat_topology.routeTable(template, vpc_resource, tier_name, az, subnet_name)
     route_table_association_name = subnet_name + "RouteAssociation"
     subnet_parameter, subnet_resource = createSubnet(template, subnet_name, vpc_resource, subnet, az)
     subnet_parameters.append(subnet_parameter)
     subnet_resources.append(subnet_resource)
     associateRouteTable(template, route_table_association_name, private_route_table, subnet_name)
-    template.add_resource(EIP(eip_name, Domain="vpc"))
-    template.add_resource(NatGateway(nat_gw_name, AllocationId=GetAtt(eip_name, 'AllocationId'), SubnetId=Ref(subnet_name)))
-    template.add_resource(Route(nat_gw_route_name, RouteTableId=Ref(private_route_table), DestinationCidrBlock=internet_cidr_block, NatGatewayId=Ref(nat_gw_name)))
+    nat_topology.natRoute(template, tier_name, az, subnet_name)
   return subnet_parameters, subnet_resources
+
+def createVPCEndpoints(template, vpc_parameter, vpc_resource, services, interface_subnets=None):
+  # Gateway endpoints for S3 and DynamoDB on every route table of the template, so that traffic
+  # bypasses the NAT gateways, and Interface endpoints in interface_subnets (one per AZ) for the
+  # other services, reachable over HTTPS from the VPC. Call after the networks are created.
+  endpoints = []
+  route_tables = [Ref(resource) for resource in template.resources.values() if isinstance(resource, RouteTable)]
+  interface_services = [service for service in services if service not in GATEWAY_ENDPOINT_SERVICES]
+  if interface_services and not interface_subnets:
+    raise ValueError("Interface endpoints for {} need subnets".format(", ".join(interface_services)))
+  for service in services:
+    if service in GATEWAY_ENDPOINT_SERVICES:
+      endpoint_name = ENDPOINT_NAMES[service] + "GatewayEndpoint"
+      endpoints.append(template.add_resource(VPCEndpoint(endpoint_name, VpcId=Ref(vpc_resource), ServiceName=Sub("com.amazonaws.${AWS::Region}." + service), VpcEndpointType="Gateway", RouteTableIds=route_tables)))
+  if interface_services:
+    security_group = template.add_resource(SecurityGroup("VPCEndpointSecurityGroup", VpcId=Ref(vpc_resource), GroupDescription="HTTPS from the VPC to its interface endpoints", SecurityGroupIngress=[SecurityGroupRule(IpProtocol="tcp", FromPort="443", ToPort="443", CidrIp=Ref(vpc_parameter))]))
+    for service in interface_services:
+      endpoint_name = ENDPOINT_NAMES.get(service, "".join(part.capitalize() for part in re.split(r'[^A-Za-z0-9]', service))) + "InterfaceEndpoint"
+      endpoints.append(template.add_resource(VPCEndpoint(endpoint_name, VpcId=Ref(vpc_resource), ServiceName=Sub("com.amazonaws.${AWS::Region}." + service), VpcEndpointType="Interface", PrivateDnsEnabled=True, SubnetIds=[Ref(subnet) for subnet in interface_subnets], SecurityGroupIds=[Ref(security_group)])))
+  return endpoints